@@ -17,6 +17,9 @@ class RestaurantMenuItemInline(admin.TabularInline):
     model = RestaurantMenuItem
     extra = 0
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('restaurant', 'product')
+
 
 @admin.register(Restaurant)
 class RestaurantAdmin(admin.ModelAdmin):
@@ -29,6 +32,11 @@ class RestaurantAdmin(admin.ModelAdmin):
         'name',
         'address',
         'contact_phone',
+        'max_active_orders',
+    ]
+    readonly_fields = [
+        'latitude',
+        'longitude',
     ]
     inlines = [
         RestaurantMenuItemInline
@@ -129,14 +137,6 @@ class OrderItemInline(admin.TabularInline):
         return "—"
     get_total_price.short_description = 'общая стоимость'
 
-    def save_formset(self, request, form, formset, change):
-        instances = formset.save(commit=False)
-        for instance in instances:
-            if instance.product and not instance.price:
-                instance.price = instance.product.price
-        formset.save()
-        super().save_formset(request, form, formset, change)
-
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -161,7 +161,7 @@ class OrderAdmin(admin.ModelAdmin):
         'address'
     ]
     list_filter = ['status', 'created_at']
-    readonly_fields = ['created_at']
+    readonly_fields = ['created_at', 'total_cost']
     inlines = [OrderItemInline]
 
     fieldsets = (
@@ -188,11 +188,26 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ['restaurant'],
         }),
         ('Служебная информация', {
-            'fields': ['created_at'],
+            'fields': ['created_at', 'total_cost'],
             'classes': ['collapse']
         }),
     )
 
+    def save_formset(self, request, form, formset, change):
+        instances = formset.save(commit=False)
+        for instance in instances:
+            if instance.product and not instance.price:
+                instance.price = instance.product.price
+        super().save_formset(request, form, formset, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        order = form.instance
+        total_cost = order.calculate_total_cost()
+        if order.total_cost != total_cost:
+            order.total_cost = total_cost
+            order.save(update_fields=['total_cost', 'updated_at'])
+
     def response_change(self, request, obj):
         """Перенаправляет на страницу, указанную в параметре next, после сохранения заказа"""
         response = super().response_change(request, obj)
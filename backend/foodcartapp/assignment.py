@@ -0,0 +1,231 @@
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from geocoder_cache.services import enqueue_geocoding, get_cached_coordinates
+
+from .caching import get_restaurant_index
+from .models import Order, OrderEvent
+from .restaurant_load import change_restaurant_loads, get_load_changes, get_restaurant_loads
+from .signals import dump_order_event_payload
+
+
+class AssignmentSolver:
+    """Распределяет заказы по ресторанам с наименьшей суммой расстояний при ограниченной вместимости.
+
+    Сначала заказы раздаются жадно, от самых коротких пар заказ-ресторан к
+    длинным. Затем решение чинится: заказ, которому не хватило места, занимает
+    его в полном ресторане, если оттуда можно перевести другой заказ в
+    свободный, а заказы переходят в более близкие рестораны или меняются
+    ресторанами, пока это сокращает общий путь.
+    """
+
+    def __init__(self, distances, capacities):
+        """distances — {id заказа: {id ресторана: км}}, capacities — {id ресторана: сколько заказов ещё примет}."""
+        self.distances = distances
+        self.remaining = {restaurant_id: max(0, capacity) for restaurant_id, capacity in capacities.items()}
+        self.assignment = {}
+        self.members = defaultdict(set)
+
+    def solve(self, max_passes=3):
+        """Возвращает {id заказа: id ресторана}. Заказы, которым не нашлось места, в ответ не попадают."""
+        self._assign_greedily()
+        for _ in range(max_passes):
+            placed = self._place_unassigned()
+            improved = self._improve()
+            if not placed and not improved:
+                break
+        return dict(self.assignment)
+
+    def total_distance(self):
+        return sum(self.distances[order_id][restaurant_id] for order_id, restaurant_id in self.assignment.items())
+
+    def _assign(self, order_id, restaurant_id):
+        self.assignment[order_id] = restaurant_id
+        self.members[restaurant_id].add(order_id)
+        self.remaining[restaurant_id] -= 1
+
+    def _unassign(self, order_id):
+        restaurant_id = self.assignment.pop(order_id)
+        self.members[restaurant_id].discard(order_id)
+        self.remaining[restaurant_id] += 1
+
+    def _has_room(self, restaurant_id):
+        return self.remaining.get(restaurant_id, 0) > 0
+
+    def _assign_greedily(self):
+        pairs = sorted(
+            (distance, order_id, restaurant_id)
+            for order_id, row in self.distances.items()
+            for restaurant_id, distance in row.items()
+            if self._has_room(restaurant_id)
+        )
+        for _, order_id, restaurant_id in pairs:
+            if order_id not in self.assignment and self._has_room(restaurant_id):
+                self._assign(order_id, restaurant_id)
+
+    def _place_unassigned(self):
+        """Находит место заказам без ресторана, переводя другие заказы в свободные рестораны."""
+        unassigned = [
+            order_id for order_id, row in self.distances.items()
+            if order_id not in self.assignment and row
+        ]
+        unassigned.sort(key=lambda order_id: min(self.distances[order_id].values()))
+        placed = False
+        for order_id in unassigned:
+            free_restaurants = {restaurant_id for restaurant_id in self.remaining if self._has_room(restaurant_id)}
+            if not free_restaurants:
+                break
+            best = None
+            for restaurant_id, distance in self.distances[order_id].items():
+                if restaurant_id in free_restaurants:
+                    if best is None or distance < best[0]:
+                        best = (distance, restaurant_id, None, None)
+                    continue
+                for moved_order_id in self.members[restaurant_id]:
+                    row = self.distances[moved_order_id]
+                    for free_restaurant_id in free_restaurants.intersection(row):
+                        cost = distance + row[free_restaurant_id] - row[restaurant_id]
+                        if best is None or cost < best[0]:
+                            best = (cost, restaurant_id, moved_order_id, free_restaurant_id)
+            if best is None:
+                continue
+            _, restaurant_id, moved_order_id, free_restaurant_id = best
+            if moved_order_id is not None:
+                self._unassign(moved_order_id)
+                self._assign(moved_order_id, free_restaurant_id)
+            self._assign(order_id, restaurant_id)
+            placed = True
+        return placed
+
+    def _improve(self):
+        """Переводит заказы в более близкие рестораны и меняет пары заказов ресторанами, если путь сокращается."""
+        improved = False
+        for order_id in list(self.assignment):
+            row = self.distances[order_id]
+            restaurant_id = self.assignment[order_id]
+            current_distance = row[restaurant_id]
+            closer_restaurants = sorted(
+                (distance, other_restaurant_id)
+                for other_restaurant_id, distance in row.items()
+                if distance < current_distance
+            )
+            for distance, other_restaurant_id in closer_restaurants:
+                if self._has_room(other_restaurant_id):
+                    self._unassign(order_id)
+                    self._assign(order_id, other_restaurant_id)
+                    improved = True
+                    break
+                swap_order_id = next(
+                    (
+                        other_order_id
+                        for other_order_id in self.members[other_restaurant_id]
+                        if restaurant_id in self.distances[other_order_id]
+                        and distance + self.distances[other_order_id][restaurant_id]
+                        < current_distance + self.distances[other_order_id][other_restaurant_id]
+                    ),
+                    None,
+                )
+                if swap_order_id is not None:
+                    self._unassign(order_id)
+                    self._unassign(swap_order_id)
+                    self._assign(order_id, other_restaurant_id)
+                    self._assign(swap_order_id, restaurant_id)
+                    improved = True
+                    break
+        return improved
+
+
+def get_open_unassigned_orders():
+    return (
+        Order.objects
+        .filter(restaurant__isnull=True)
+        .exclude(status='completed')
+        .order_by('created_at', 'id')
+    )
+
+
+def get_restaurant_capacities(restaurants):
+    """Возвращает {id ресторана: сколько заказов он ещё может принять} с учётом очереди кухни."""
+    loads = get_restaurant_loads(restaurant.pk for restaurant in restaurants)
+    return {restaurant.pk: restaurant.max_active_orders - loads[restaurant.pk] for restaurant in restaurants}
+
+
+def suggest_assignments(orders=None):
+    """Подбирает рестораны открытым заказам без ресторана.
+
+    Для каждого заказа рассматриваются не больше ASSIGNMENT_CANDIDATES_LIMIT
+    ближайших из ресторанов, способных его выполнить, в радиусе
+    NEAREST_RESTAURANTS_MAX_KM. Возвращает (список (заказ, ресторан, км),
+    заказы, которым ресторан не подобран).
+    """
+    if orders is None:
+        orders = get_open_unassigned_orders()
+    orders = list(orders.with_available_restaurants())
+
+    order_coords, pending_addresses = get_cached_coordinates({order.address for order in orders})
+    enqueue_geocoding(pending_addresses)
+
+    restaurants = {
+        restaurant.pk: restaurant
+        for order in orders
+        for restaurant in order.available_restaurants
+    }
+    index = get_restaurant_index()
+    distances = {}
+    for order in orders:
+        coords = order_coords.get(order.address)
+        if not coords:
+            continue
+        distances[order.pk] = dict(index.nearest(
+            coords,
+            k=settings.ASSIGNMENT_CANDIDATES_LIMIT,
+            max_km=settings.NEAREST_RESTAURANTS_MAX_KM,
+            keys={restaurant.pk for restaurant in order.available_restaurants},
+        ))
+
+    solution = AssignmentSolver(distances, get_restaurant_capacities(restaurants.values())).solve()
+
+    assignments = []
+    unassigned_orders = []
+    for order in orders:
+        restaurant_id = solution.get(order.pk)
+        if restaurant_id is None:
+            unassigned_orders.append(order)
+        else:
+            assignments.append((order, restaurants[restaurant_id], round(distances[order.pk][restaurant_id], 2)))
+    return assignments, unassigned_orders
+
+
+def apply_assignments():
+    """Подбирает и сразу назначает рестораны открытым заказам без ресторана. Возвращает то же, что suggest_assignments.
+
+    Заказы блокируются до конца транзакции, поэтому два менеджера не
+    назначат один заказ дважды. Заказы сохраняются одним bulk_update, а
+    события для страницы заказов пишутся одним bulk_create.
+    """
+    with transaction.atomic():
+        assignments, unassigned_orders = suggest_assignments(get_open_unassigned_orders().select_for_update())
+        now = timezone.now()
+        orders = []
+        transitions = []
+        for order, restaurant, _ in assignments:
+            transitions.append(((order.restaurant_id, order.status), (restaurant.pk, order.status)))
+            order.restaurant = restaurant
+            order.updated_at = now
+            order.loaded_kitchen_state = (restaurant.pk, order.status)
+            orders.append(order)
+        Order.objects.bulk_update(orders, ['restaurant', 'updated_at'], batch_size=500)
+        OrderEvent.objects.bulk_create(
+            [
+                OrderEvent(order_id=order.pk, kind=OrderEvent.UPDATED, payload=dump_order_event_payload(order))
+                for order in orders
+            ],
+            batch_size=500,
+        )
+        # bulk_update не шлёт сигналы, поэтому загрузку ресторанов меняем сами
+        transaction.on_commit(partial(change_restaurant_loads, get_load_changes(transitions)))
+    return assignments, unassigned_orders
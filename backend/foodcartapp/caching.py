@@ -0,0 +1,136 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from .models import Product, Restaurant
+from .spatial import RestaurantIndex
+
+
+CATALOG_NAMESPACE = 'catalog'
+RESTAURANTS_NAMESPACE = 'restaurants'
+# Снимок каталога устаревает и сам, даже если смена версии до процесса не дошла
+CATALOG_SNAPSHOT_TIMEOUT = 10 * 60
+
+
+def _version_key(namespace):
+    return f'foodcartapp:{namespace}:version'
+
+
+def get_version(namespace):
+    """Возвращает текущую версию данных пространства имён, создавая её при первом обращении."""
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # После вытеснения ключа из кэша версия не должна совпасть с одной из прежних
+        cache.add(_version_key(namespace), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def bump_version(namespace):
+    """Меняет версию пространства имён, после чего все закэшированные по старой версии данные устаревают.
+
+    Версия — время смены в наносекундах, а не cache.incr: в кэшах без
+    атомарного incr две одновременные смены слились бы в одну, и снимок,
+    собранный между ними, остался бы под новой версией.
+    """
+    version = time.time_ns()
+    cache.set(_version_key(namespace), version, timeout=None)
+    return version
+
+
+def cache_view(*namespaces, timeout=10 * 60):
+    """Кэширует успешные ответы GET-представления, пока не сменится версия одного из пространств имён.
+
+    Ответ общий для всех пользователей, поэтому подходит только для страниц
+    без персональных данных. Проверки доступа ставятся снаружи декоратора.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            versions = '.'.join(str(get_version(namespace)) for namespace in namespaces)
+            path_hash = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+            key = f'foodcartapp:view:{view_func.__name__}:{versions}:{path_hash}'
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def dump_product(product):
+    """Готовит словарь товара для API каталога."""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': product.image.url,
+        'restaurant': {
+            'id': product.id,
+            'name': product.name,
+        }
+    }
+
+
+def build_catalog_snapshot():
+    """Собирает JSON каталога доступных товаров и его ETag."""
+    products = Product.objects.select_related('category').available()
+    content = JSONRenderer().render([dump_product(product) for product in products])
+    etag = '"{}"'.format(hashlib.sha1(content).hexdigest())
+    return content, etag
+
+
+def get_catalog_snapshot():
+    """Возвращает (content, etag) каталога из кэша, пересобирая снимок при смене версии."""
+    key = f'foodcartapp:{CATALOG_NAMESPACE}:{get_version(CATALOG_NAMESPACE)}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_catalog_snapshot()
+        cache.set(key, snapshot, timeout=CATALOG_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+_restaurant_index = (None, None)
+
+
+def get_restaurant_index():
+    """Возвращает пространственный индекс всех ресторанов с координатами.
+
+    Индекс один на процесс и строится заново, только когда сменилась версия
+    RESTAURANTS_NAMESPACE. Поиск по части ресторанов сужается через keys.
+    """
+    global _restaurant_index
+    version = get_version(RESTAURANTS_NAMESPACE)
+    cached_version, index = _restaurant_index
+    if cached_version == version:
+        return index
+
+    points = {
+        pk: (latitude, longitude)
+        for pk, latitude, longitude in (
+            Restaurant.objects
+            .filter(latitude__isnull=False, longitude__isnull=False)
+            .values_list('pk', 'latitude', 'longitude')
+        )
+    }
+    index = RestaurantIndex(points)
+    _restaurant_index = (version, index)
+    return index
@@ -0,0 +1,184 @@
+"""Прогноз времени доставки по истории выполненных заказов.
+
+Для каждого ресторана и диапазона расстояний до клиента хранится
+DeliveryTimeStats: число доставок, среднее время и разброс. Статистика
+пополняется по одной доставке, когда заказ выполнен, а команда
+fit_delivery_eta пересчитывает её с нуля, читая заказы частями.
+
+Если по ресторану и расстоянию доставок мало, прогноз берётся по ресторану
+на любом расстоянии, затем по всем ресторанам на этом расстоянии и, наконец,
+по всем доставкам.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from geocoder_cache.models import GeoPlace
+from geocoder_cache.services import get_cached_coordinates, normalize_address
+
+from .caching import get_restaurant_index
+from .models import DeliveryTimeStats, Order, Restaurant
+from .restaurant_load import get_restaurant_loads
+from .services import get_restaurant_coordinates, get_restaurant_distances
+from .spatial import distance_km
+
+
+# Доставки дольше суток — ошибки ввода, а не реальное время
+MAX_DELIVERY_MINUTES = 24 * 60
+FIT_CHUNK_SIZE = 2000
+
+
+def get_delivery_minutes(created_at, delivered_at):
+    """Возвращает время доставки в минутах или None, если время указано с ошибкой."""
+    minutes = (delivered_at - created_at).total_seconds() / 60
+    if 0 < minutes <= MAX_DELIVERY_MINUTES:
+        return minutes
+    return None
+
+
+def get_stats_keys(restaurant_id, distance):
+    """Возвращает ключи (id ресторана, диапазон расстояний) статистики от самой точной к самой общей."""
+    keys = [(restaurant_id, DeliveryTimeStats.ANY_DISTANCE)]
+    if distance is not None:
+        bucket = min(int(distance // settings.ETA_DISTANCE_BUCKET_KM), settings.ETA_DISTANCE_BUCKETS - 1)
+        keys = [(restaurant_id, bucket)] + keys + [(DeliveryTimeStats.ALL_RESTAURANTS, bucket)]
+    keys.append((DeliveryTimeStats.ALL_RESTAURANTS, DeliveryTimeStats.ANY_DISTANCE))
+    return list(dict.fromkeys(keys))
+
+
+def _get_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def fit_delivery_time_stats(chunk_size=FIT_CHUNK_SIZE):
+    """Пересчитывает статистику по всем выполненным заказам. Возвращает число учтённых доставок.
+
+    Заказы читаются через iterator() по chunk_size штук, координаты адресов
+    каждой части берутся из GeoPlace одним запросом, так что в памяти
+    никогда не оказывается вся таблица заказов.
+    """
+    restaurant_coords = {
+        pk: (latitude, longitude)
+        for pk, latitude, longitude in Restaurant.objects.values_list('pk', 'latitude', 'longitude')
+    }
+    deliveries = (
+        Order.objects
+        .filter(status='completed', restaurant__isnull=False, delivered_at__isnull=False)
+        .order_by()
+        .values_list('restaurant_id', 'address', 'created_at', 'delivered_at')
+    )
+
+    stats = {}
+    fitted = 0
+    for chunk in _get_chunks(deliveries.iterator(chunk_size=chunk_size), chunk_size):
+        places = {
+            address: (latitude, longitude)
+            for address, latitude, longitude in (
+                GeoPlace.objects
+                .filter(address__in={normalize_address(address) for _, address, _, _ in chunk})
+                .values_list('address', 'latitude', 'longitude')
+            )
+        }
+        for restaurant_id, address, created_at, delivered_at in chunk:
+            minutes = get_delivery_minutes(created_at, delivered_at)
+            if minutes is None:
+                continue
+            distance = distance_km(places.get(normalize_address(address)), restaurant_coords.get(restaurant_id))
+            for key in get_stats_keys(restaurant_id, distance):
+                if key not in stats:
+                    stats[key] = DeliveryTimeStats(restaurant_id=key[0], distance_bucket=key[1])
+                stats[key].add(minutes)
+            fitted += 1
+
+    with transaction.atomic():
+        DeliveryTimeStats.objects.all().delete()
+        DeliveryTimeStats.objects.bulk_create(stats.values(), batch_size=500)
+    return fitted
+
+
+def record_delivery(restaurant_id, address, created_at, delivered_at):
+    """Добавляет в статистику одну доставку выполненного заказа."""
+    minutes = get_delivery_minutes(created_at, delivered_at)
+    if minutes is None:
+        return
+    order_coords = get_cached_coordinates([address])[0].get(address)
+    restaurant_coords = Restaurant.objects.filter(pk=restaurant_id).values_list('latitude', 'longitude').first()
+    distance = distance_km(order_coords, restaurant_coords)
+
+    with transaction.atomic():
+        # Строки блокируются в одном порядке, чтобы параллельные доставки не ждали друг друга по кругу
+        for stats_restaurant_id, bucket in sorted(get_stats_keys(restaurant_id, distance)):
+            stats, _ = (
+                DeliveryTimeStats.objects
+                .select_for_update()
+                .get_or_create(restaurant_id=stats_restaurant_id, distance_bucket=bucket)
+            )
+            stats.add(minutes)
+            stats.save()
+
+
+class DeliveryTimePredictor:
+    """Прогнозирует время доставки по статистике, загруженной одним запросом."""
+
+    def __init__(self, min_samples=None):
+        if min_samples is None:
+            min_samples = settings.ETA_MIN_SAMPLES
+        self.stats = {
+            (stats.restaurant_id, stats.distance_bucket): stats
+            for stats in DeliveryTimeStats.objects.filter(count__gte=max(min_samples, 1))
+        }
+
+    def predict(self, restaurant_id, distance):
+        """Возвращает ожидаемое время доставки в минутах или None, если доставок для прогноза мало."""
+        for key in get_stats_keys(restaurant_id, distance):
+            stats = self.stats.get(key)
+            if stats is not None:
+                return round(stats.mean_minutes)
+        return None
+
+    def predict_order(self, order, order_coords):
+        """Прогноз для заказа: из назначенного ресторана, а без него — из первого предложенного."""
+        if order.restaurant_id is not None:
+            restaurant = order.restaurant
+            distance = distance_km(order_coords.get(order.address), get_restaurant_coordinates(restaurant))
+        elif getattr(order, 'restaurant_distances', None):
+            restaurant, distance = order.restaurant_distances[0]
+        else:
+            return None
+        return self.predict(restaurant.pk, distance)
+
+
+def predict_new_order_minutes(address, product_ids):
+    """Прогнозирует время доставки нового заказа из ресторана, который первым предложат менеджеру.
+
+    Пока адрес не геокодирован, прогноз строится по всем доставкам.
+    """
+    product_ids = set(product_ids)
+    predictor = DeliveryTimePredictor()
+    delivery_coords = get_cached_coordinates([address])[0].get(address)
+    if delivery_coords is None:
+        return predictor.predict(DeliveryTimeStats.ALL_RESTAURANTS, None)
+
+    restaurants = list(
+        Restaurant.objects
+        .filter(menu_items__product__in=product_ids, menu_items__availability=True)
+        .annotate(products_count=Count('menu_items'))
+        .filter(products_count=len(product_ids))
+    )
+    ranked = get_restaurant_distances(
+        delivery_coords,
+        restaurants,
+        loads=get_restaurant_loads(restaurant.pk for restaurant in restaurants),
+        index=get_restaurant_index(),
+    )
+    if not ranked:
+        return predictor.predict(DeliveryTimeStats.ALL_RESTAURANTS, None)
+    restaurant, distance = ranked[0]
+    return predictor.predict(restaurant.pk, distance)
@@ -0,0 +1,224 @@
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+
+from foodcartapp.models import Order, Product
+from geocoder_cache.models import GeoPlace
+from star_burger.benchmarking import percentile
+
+
+# Переменные окружения, которыми каждый режим настраивает DATABASES в settings.py
+CONNECTION_MODES = {
+    'none': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': 'False'},
+    'persistent': {'DB_CONN_MAX_AGE': '60', 'DB_POOL': 'False'},
+    'pool': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': 'True'},
+}
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает режимы соединений с БД под параллельной нагрузкой: без '
+        'постоянных соединений, с CONN_MAX_AGE и с пулом psycopg. Для каждого '
+        'режима запускает gunicorn и обстреливает product_list_api и register_order. '
+        'Работает с БД из DATABASE_URL, поэтому запускайте его на копии, заполненной '
+        'generate_load_data, а не на боевой базе. Созданные заказы удаляются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modes', default=','.join(CONNECTION_MODES),
+            help=f'Режимы через запятую: {", ".join(CONNECTION_MODES)}',
+        )
+        parser.add_argument('--workers', type=int, default=3, help='Воркеров gunicorn')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков в каждом воркере gunicorn')
+        parser.add_argument('--concurrency', type=int, default=16, help='Параллельных клиентов')
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на сценарий')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Куда сохранить результаты в JSON, по умолчанию — в stdout')
+
+    def handle(self, *args, **options):
+        modes = [mode for mode in options['modes'].split(',') if mode]
+        unknown_modes = set(modes) - CONNECTION_MODES.keys()
+        if unknown_modes:
+            raise CommandError(f'Неизвестные режимы: {", ".join(sorted(unknown_modes))}')
+        if 'pool' in modes and connection.vendor != 'postgresql':
+            self.stderr.write(self.style.WARNING('Пул соединений доступен только для PostgreSQL, режим pool пропущен'))
+            modes.remove('pool')
+
+        self.product_ids = list(Product.objects.available().values_list('id', flat=True))
+        if not self.product_ids:
+            raise CommandError('В меню нет доступных товаров, сначала запустите generate_load_data')
+        # Адрес с известными координатами, чтобы заказы не уходили в очередь геокодирования
+        self.address = (
+            GeoPlace.objects.exclude(latitude=None).values_list('address', flat=True).first()
+            or 'Москва, Красная площадь, 1'
+        )
+        self.random = random.Random(options['seed'])
+        self.requests_count = options['requests']
+        self.concurrency = options['concurrency']
+
+        report = {
+            'database': connection.vendor,
+            'workers': options['workers'],
+            'threads': options['threads'],
+            'concurrency': self.concurrency,
+            'requests': self.requests_count,
+            'modes': {},
+        }
+        for mode in modes:
+            self.stderr.write(f'Режим {mode}')
+            with self.run_gunicorn(mode, options['workers'], options['threads']) as base_url:
+                report['modes'][mode] = self.run_scenarios(base_url)
+
+        content = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(content)
+            self.stderr.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
+        else:
+            self.stdout.write(content)
+
+    def run_gunicorn(self, mode, workers, threads):
+        return GunicornServer(
+            workers=workers,
+            threads=threads,
+            env={
+                **CONNECTION_MODES[mode],
+                'DEBUG': 'False',
+                'ALLOWED_HOSTS': '127.0.0.1',
+                'SECURE_SSL_REDIRECT': 'False',
+                'GEOCODER_BACKGROUND_WORKER': 'False',
+                'QUERY_BUDGET_MODE': 'off',
+            },
+        )
+
+    def run_scenarios(self, base_url):
+        created_order_ids = []
+        created_order_ids_lock = threading.Lock()
+
+        def register_order(session):
+            response = session.post(
+                base_url + reverse('foodcartapp:register_order'),
+                json={
+                    'firstname': 'Бенчмарк',
+                    'lastname': 'Бенчмарков',
+                    'phonenumber': '+79160000000',
+                    'address': self.address,
+                    'products': [
+                        {'product': product_id, 'quantity': 1}
+                        for product_id in self.random.sample(self.product_ids, min(3, len(self.product_ids)))
+                    ],
+                },
+            )
+            if response.ok:
+                with created_order_ids_lock:
+                    created_order_ids.append(response.json()['id'])
+            return response
+
+        scenarios = {
+            'product_list_api': lambda session: session.get(base_url + reverse('foodcartapp:product_list_api')),
+            'register_order': register_order,
+        }
+        try:
+            return {name: self.measure(name, request) for name, request in scenarios.items()}
+        finally:
+            Order.objects.filter(id__in=created_order_ids).delete()
+
+    def measure(self, name, request):
+        local = threading.local()
+
+        def timed_request(_):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            started_at = time.perf_counter()
+            response = request(local.session)
+            return time.perf_counter() - started_at, response.status_code
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(timed_request, range(self.requests_count)))
+        total_time = time.perf_counter() - started_at
+
+        latencies = [latency for latency, _ in results]
+        errors = sum(1 for _, status_code in results if status_code >= 400)
+        result = {
+            'latency_ms': {
+                'mean': statistics.mean(latencies) * 1000,
+                'p50': percentile(latencies, 50) * 1000,
+                'p90': percentile(latencies, 90) * 1000,
+                'p99': percentile(latencies, 99) * 1000,
+                'max': max(latencies) * 1000,
+            },
+            'throughput_rps': len(latencies) / total_time,
+            'errors': errors,
+        }
+        self.stderr.write(
+            f'  {name}: p50 {result["latency_ms"]["p50"]:.1f} мс, '
+            f'p99 {result["latency_ms"]["p99"]:.1f} мс, '
+            f'{result["throughput_rps"]:.0f} запросов/с, ошибок {errors}'
+        )
+        return result
+
+
+class GunicornServer:
+    """Запускает gunicorn с проектом в отдельном процессе на время блока with."""
+
+    def __init__(self, workers, threads, env, startup_timeout=30):
+        self.workers = workers
+        self.threads = threads
+        self.env = env
+        self.startup_timeout = startup_timeout
+        self.port = get_free_port()
+        self.process = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn',
+                '--bind', f'127.0.0.1:{self.port}',
+                '--workers', str(self.workers),
+                '--threads', str(self.threads),
+                '--log-level', 'warning',
+                'star_burger.wsgi:application',
+            ],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, **self.env},
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError('gunicorn завершился при запуске')
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=1):
+                    return self.base_url
+            except OSError:
+                time.sleep(0.2)
+        self.process.terminate()
+        raise CommandError('gunicorn не запустился')
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait()
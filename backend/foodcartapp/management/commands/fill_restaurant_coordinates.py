@@ -1,25 +1,36 @@
 from django.core.management.base import BaseCommand
+
+from foodcartapp.caching import RESTAURANTS_NAMESPACE, bump_version
 from foodcartapp.models import Restaurant
-from geocoder_cache.services import get_coordinates_from_cache
 
 
 class Command(BaseCommand):
-    help = 'Заполняет координаты ресторанов'
+    help = 'Заполняет координаты ресторанов, у которых они не найдены для текущего адреса'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Обновить координаты всех ресторанов, а не только устаревшие',
+        )
+        parser.add_argument(
+            '--no-api',
+            action='store_true',
+            help='Брать координаты только из кэша геокодера, новые адреса поставить в очередь',
+        )
 
     def handle(self, *args, **options):
-        restaurants = Restaurant.objects.filter(address__isnull=False).exclude(address='')
-        
-        for restaurant in restaurants:
-            coords = get_coordinates_from_cache(restaurant.address)
-            if coords:
-                from geocoder_cache.models import GeoPlace
-                cache_obj, _ = GeoPlace.objects.get_or_create(address=restaurant.address)
-                cache_obj.latitude, cache_obj.longitude = coords
-                cache_obj.save()
-                self.stdout.write(
-                    self.style.SUCCESS(f'Координаты для {restaurant.name}: {coords}')
-                )
-            else:
-                self.stdout.write(
-                    self.style.WARNING(f'Не удалось получить координаты для {restaurant.name}')
-                ) 
\ No newline at end of file
+        restaurants = Restaurant.objects.all()
+        if not options['all']:
+            restaurants = restaurants.with_outdated_coordinates()
+        checked = restaurants.count()
+        unlocated_restaurants = restaurants.update_coordinates(geocode=not options['no_api'])
+        bump_version(RESTAURANTS_NAMESPACE)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено ресторанов: {checked - len(unlocated_restaurants)}'
+        ))
+        for restaurant in unlocated_restaurants:
+            self.stdout.write(self.style.WARNING(
+                f'Не удалось получить координаты для {restaurant.name}: {restaurant.address or "адрес не указан"}'
+            ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.eta import FIT_CHUNK_SIZE, fit_delivery_time_stats
+from foodcartapp.models import DeliveryTimeStats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику времени доставки по всем выполненным заказам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=FIT_CHUNK_SIZE,
+            help='Сколько заказов читать из БД за раз',
+        )
+
+    def handle(self, *args, **options):
+        fitted = fit_delivery_time_stats(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Учтено доставок: {fitted}, групп статистики: {DeliveryTimeStats.objects.count()}'
+        ))
@@ -0,0 +1,264 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from foodcartapp.caching import CATALOG_NAMESPACE, RESTAURANTS_NAMESPACE, bump_version
+from foodcartapp.eta import fit_delivery_time_stats
+from foodcartapp.models import (
+    Order,
+    OrderItem,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from geocoder_cache.models import GeoPlace
+
+
+FIRSTNAMES = ['Иван', 'Мария', 'Алексей', 'Анна', 'Дмитрий', 'Елена', 'Сергей', 'Ольга', 'Павел', 'Наталья']
+LASTNAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов', 'Новиков']
+STREETS = ['Тверская', 'Арбат', 'Мясницкая', 'Пятницкая', 'Покровка', 'Сретенка', 'Маросейка', 'Остоженка']
+COMMENTS = ['', '', '', '', 'Позвонить за 10 минут', 'Без лука', 'Домофон не работает', 'Аллергия на орехи']
+
+# Доли статусов и часы заказов: большая часть истории уже выполнена, пики в обед и вечером
+STATUS_WEIGHTS = {
+    'completed': 90,
+    'delivering': 2,
+    'preparing': 3,
+    'confirmed': 2,
+    'new': 3,
+}
+HOUR_WEIGHTS = [1, 0, 0, 0, 0, 0, 1, 2, 3, 4, 5, 8, 12, 12, 9, 6, 6, 8, 12, 12, 10, 7, 4, 2]
+
+
+@contextmanager
+def manual_timestamps(model, *field_names):
+    """Временно отключает auto_now/auto_now_add, чтобы сохранить заданные даты."""
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт синтетические рестораны, меню, заказы и координаты адресов '
+        'для нагрузочного тестирования. При одинаковом --seed данные совпадают.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=20)
+        parser.add_argument('--categories', type=int, default=8)
+        parser.add_argument('--products', type=int, default=150)
+        parser.add_argument(
+            '--menu-density', type=float, default=0.8,
+            help='Вероятность того, что товар есть в меню ресторана',
+        )
+        parser.add_argument(
+            '--availability', type=float, default=0.95,
+            help='Вероятность того, что позиция меню в продаже',
+        )
+        parser.add_argument('--orders', type=int, default=100_000)
+        parser.add_argument('--max-items', type=int, default=6, help='Наибольшее число позиций в заказе')
+        parser.add_argument('--addresses', type=int, default=20_000, help='Сколько разных адресов доставки')
+        parser.add_argument('--days', type=int, default=180, help='За сколько последних дней создавать заказы')
+        parser.add_argument(
+            '--bbox', default='55.57,37.36,55.91,37.84',
+            help='Границы города: min_lat,min_lng,max_lat,max_lng',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        try:
+            min_lat, min_lng, max_lat, max_lng = map(float, options['bbox'].split(','))
+        except ValueError:
+            raise CommandError('--bbox задаётся как min_lat,min_lng,max_lat,max_lng')
+        if options['orders'] > 0:
+            for option in ['restaurants', 'products', 'addresses', 'max_items']:
+                if options[option] < 1:
+                    raise CommandError(f'Для заказов нужно --{option.replace("_", "-")} не меньше 1')
+        self.bbox = (min_lat, min_lng, max_lat, max_lng)
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        restaurants = self.create_restaurants(options['restaurants'])
+        products = self.create_products(options['categories'], options['products'])
+        self.create_menu(restaurants, products, options['menu_density'], options['availability'])
+        addresses = self.create_addresses(options['addresses'])
+        self.create_orders(
+            options['orders'], restaurants, products, addresses,
+            options['max_items'], options['days'],
+        )
+        bump_version(CATALOG_NAMESPACE)
+        bump_version(RESTAURANTS_NAMESPACE)
+        # Заказы созданы через bulk_create, без сигналов, поэтому статистика доставки считается заново
+        self.stdout.write(f'Доставок в статистике: {fit_delivery_time_stats()}')
+
+    def random_point(self):
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        return (
+            round(self.random.uniform(min_lat, max_lat), 6),
+            round(self.random.uniform(min_lng, max_lng), 6),
+        )
+
+    def random_address(self, number):
+        street = self.random.choice(STREETS)
+        return f'Москва, ул. {street}, д. {number}, кв. {self.random.randint(1, 300)}'
+
+    def random_phone(self):
+        return f'+7916{self.random.randint(0, 9_999_999):07d}'
+
+    def create_places(self, addresses):
+        GeoPlace.objects.bulk_create(
+            [
+                GeoPlace(address=address, latitude=latitude, longitude=longitude)
+                for address, (latitude, longitude) in ((address, self.random_point()) for address in addresses)
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+    def create_restaurants(self, count):
+        restaurants = []
+        for number in range(1, count + 1):
+            address = f'Москва, ул. {self.random.choice(STREETS)}, д. {number}, ресторан'
+            latitude, longitude = self.random_point()
+            restaurants.append(Restaurant(
+                name=f'Star Burger #{number}',
+                address=address,
+                contact_phone=self.random_phone(),
+                latitude=latitude,
+                longitude=longitude,
+                coordinates_address=address,
+            ))
+        restaurants = Restaurant.objects.bulk_create(restaurants)
+        GeoPlace.objects.bulk_create(
+            [
+                GeoPlace(address=restaurant.address, latitude=restaurant.latitude, longitude=restaurant.longitude)
+                for restaurant in restaurants
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        self.stdout.write(f'Ресторанов: {len(restaurants)}')
+        return restaurants
+
+    def create_products(self, categories_count, count):
+        categories = ProductCategory.objects.bulk_create([
+            ProductCategory(name=f'Категория {number}')
+            for number in range(1, categories_count + 1)
+        ])
+        products = Product.objects.bulk_create(
+            [
+                Product(
+                    name=f'Блюдо {number}',
+                    category=self.random.choice(categories) if categories else None,
+                    price=Decimal(self.random.randrange(99, 999)),
+                    image=f'load_data/product_{number}.jpg',
+                    special_status=self.random.random() < 0.1,
+                    description=f'Синтетическое блюдо номер {number}',
+                )
+                for number in range(1, count + 1)
+            ],
+            batch_size=self.batch_size,
+        )
+        self.stdout.write(f'Категорий: {len(categories)}, товаров: {len(products)}')
+        return products
+
+    def create_menu(self, restaurants, products, density, availability):
+        menu_items = [
+            RestaurantMenuItem(
+                restaurant=restaurant,
+                product=product,
+                availability=self.random.random() < availability,
+            )
+            for restaurant in restaurants
+            for product in products
+            if self.random.random() < density
+        ]
+        RestaurantMenuItem.objects.bulk_create(menu_items, batch_size=self.batch_size)
+        Product.objects.filter(pk__in=[product.pk for product in products]).recalculate_available_restaurants_count()
+        self.stdout.write(f'Позиций меню: {len(menu_items)}')
+
+    def create_addresses(self, count):
+        addresses = list(dict.fromkeys(self.random_address(number) for number in range(1, count + 1)))
+        self.create_places(addresses)
+        self.stdout.write(f'Адресов доставки: {len(addresses)}')
+        return addresses
+
+    def random_created_at(self, now, days):
+        """Случайное время в прошлом, не позже чем за 3 часа до now, с учётом пиковых часов."""
+        latest = now - timedelta(hours=3)
+        day = latest - timedelta(days=self.random.randrange(days))
+        hour = self.random.choices(range(24), weights=HOUR_WEIGHTS)[0]
+        created_at = day.replace(hour=hour, minute=self.random.randrange(60), second=self.random.randrange(60))
+        if created_at > latest:
+            created_at -= timedelta(days=1)
+        return created_at
+
+    def build_order(self, now, days, restaurants, addresses):
+        status = self.random.choices(list(STATUS_WEIGHTS), weights=STATUS_WEIGHTS.values())[0]
+        created_at = self.random_created_at(now, days)
+        if status != 'completed':
+            # Незавершённые заказы — свежие
+            created_at = now - timedelta(minutes=self.random.randrange(1, 180))
+        called_at = None
+        delivered_at = None
+        if status != 'new':
+            called_at = created_at + timedelta(minutes=self.random.uniform(1, 10))
+        if status == 'completed':
+            delivered_at = created_at + timedelta(minutes=self.random.gauss(55, 15))
+
+        return Order(
+            firstname=self.random.choice(FIRSTNAMES),
+            lastname=self.random.choice(LASTNAMES),
+            phonenumber=self.random_phone(),
+            address=self.random.choice(addresses),
+            status=status,
+            payment_method=self.random.choice(['online', 'cash']),
+            comment=self.random.choice(COMMENTS),
+            created_at=created_at,
+            updated_at=delivered_at or called_at or created_at,
+            called_at=called_at,
+            delivered_at=delivered_at,
+            restaurant=self.random.choice(restaurants) if status in ('preparing', 'delivering', 'completed') else None,
+        )
+
+    def create_orders(self, count, restaurants, products, addresses, max_items, days):
+        now = timezone.now()
+        created = 0
+        with manual_timestamps(Order, 'created_at', 'updated_at'):
+            while created < count:
+                orders = [
+                    self.build_order(now, days, restaurants, addresses)
+                    for _ in range(min(self.batch_size, count - created))
+                ]
+                items = []
+                for order in orders:
+                    order_items = [
+                        (product, self.random.randint(1, 3))
+                        for product in self.random.sample(products, self.random.randint(1, min(max_items, len(products))))
+                    ]
+                    order.total_cost = sum(product.price * quantity for product, quantity in order_items)
+                    order.order_items = order_items
+
+                Order.objects.bulk_create(orders)
+                for order in orders:
+                    items.extend(
+                        OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+                        for product, quantity in order.order_items
+                    )
+                OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+
+                created += len(orders)
+                self.stdout.write(f'Заказов: {created}/{count}')
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.models import OrderEvent
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из журнала события заказов старше ORDER_EVENTS_RETENTION_HOURS часов. '
+        'Живой странице заказов нужны только свежие события, поэтому команду '
+        'стоит запускать по расписанию'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=settings.ORDER_EVENTS_RETENTION_HOURS,
+            help='Сколько последних часов журнала оставить',
+        )
+
+    def handle(self, *args, **options):
+        deleted, _ = OrderEvent.objects.filter(
+            created_at__lt=timezone.now() - timedelta(hours=options['hours']),
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(f'Удалено событий: {deleted}'))
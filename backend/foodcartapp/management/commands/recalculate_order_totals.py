@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from foodcartapp.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сохранённую стоимость заказов с суммой по их позициям и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Сколько заказов обрабатывать за один проход',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        checked = 0
+        mismatched = 0
+        last_id = 0
+
+        while True:
+            orders = list(
+                Order.objects
+                .filter(pk__gt=last_id)
+                .order_by('pk')
+                .only('pk', 'total_cost')[:chunk_size]
+            )
+            if not orders:
+                break
+            last_id = orders[-1].pk
+
+            items_cost = dict(
+                OrderItem.objects
+                .filter(order_id__gte=orders[0].pk, order_id__lte=last_id)
+                .values('order')
+                .annotate(cost=Sum(F('quantity') * F('price')))
+                .values_list('order', 'cost')
+            )
+            wrong_orders = []
+            now = timezone.now()
+            for order in orders:
+                cost = items_cost.get(order.pk) or 0
+                if order.total_cost != cost:
+                    order.total_cost = cost
+                    order.updated_at = now
+                    wrong_orders.append(order)
+
+            # bulk_update не трогает auto_now, а без updated_at исправление не увидит API заказов
+            if wrong_orders and not options['check']:
+                Order.objects.bulk_update(wrong_orders, ['total_cost', 'updated_at'])
+            checked += len(orders)
+            mismatched += len(wrong_orders)
+
+        message = f'Проверено заказов: {checked}, с неверной стоимостью: {mismatched}'
+        if mismatched and options['check']:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+
+from foodcartapp.caching import CATALOG_NAMESPACE, bump_version
+from foodcartapp.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сохранённое число ресторанов, где товар в продаже, с меню ресторанов и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        products = (
+            Product.objects
+            .annotate(menu_count=Count('menu_items', filter=Q(menu_items__availability=True)))
+            .only('pk', 'available_restaurants_count')
+        )
+        checked = 0
+        wrong_products = []
+        for product in products.iterator():
+            checked += 1
+            if product.available_restaurants_count != product.menu_count:
+                wrong_products.append(product)
+
+        if wrong_products and not options['check']:
+            Product.objects.filter(pk__in=[product.pk for product in wrong_products]).recalculate_available_restaurants_count()
+            bump_version(CATALOG_NAMESPACE)
+
+        message = f'Проверено товаров: {checked}, с неверным счётчиком: {len(wrong_products)}'
+        if wrong_products and options['check']:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
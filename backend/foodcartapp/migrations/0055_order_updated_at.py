@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0054_alter_order_address"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, verbose_name="время изменения"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["created_at", "id"], name="foodcartapp_created_460412_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0055_order_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderEvent",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("order_id", models.PositiveIntegerField(verbose_name="id заказа")),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("created", "Создан"),
+                            ("updated", "Изменён"),
+                            ("deleted", "Удалён"),
+                        ],
+                        max_length=20,
+                        verbose_name="тип события",
+                    ),
+                ),
+                ("payload", models.JSONField(default=dict, verbose_name="данные")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, db_index=True, verbose_name="время события"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "событие заказа",
+                "verbose_name_plural": "журнал событий заказов",
+            },
+        ),
+    ]
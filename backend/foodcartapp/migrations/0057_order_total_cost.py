@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:34
+
+import django.core.validators
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_order_total_cost(apps, schema_editor):
+    Order = apps.get_model("foodcartapp", "Order")
+    OrderItem = apps.get_model("foodcartapp", "OrderItem")
+    items_cost = (
+        OrderItem.objects.filter(order=OuterRef("pk"))
+        .values("order")
+        .annotate(cost=Sum(F("quantity") * F("price")))
+        .values("cost")
+    )
+    Order.objects.update(total_cost=Coalesce(Subquery(items_cost), Decimal("0")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0056_orderevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="total_cost",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                help_text="Сумма по позициям заказа, пересчитывается при их изменении",
+                max_digits=10,
+                validators=[django.core.validators.MinValueValidator(Decimal("0"))],
+                verbose_name="стоимость заказа",
+            ),
+        ),
+        migrations.RunPython(fill_order_total_cost, migrations.RunPython.noop),
+    ]
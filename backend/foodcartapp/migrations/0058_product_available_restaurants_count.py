@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_available_restaurants_count(apps, schema_editor):
+    Product = apps.get_model("foodcartapp", "Product")
+    RestaurantMenuItem = apps.get_model("foodcartapp", "RestaurantMenuItem")
+    menu_items_count = (
+        RestaurantMenuItem.objects.filter(product=OuterRef("pk"), availability=True)
+        .values("product")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Product.objects.update(
+        available_restaurants_count=Coalesce(Subquery(menu_items_count), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0057_order_total_cost"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="available_restaurants_count",
+            field=models.PositiveIntegerField(
+                db_index=True,
+                default=0,
+                editable=False,
+                help_text="Пересчитывается при изменении меню ресторанов",
+                verbose_name="ресторанов в продаже",
+            ),
+        ),
+        migrations.RunPython(
+            fill_available_restaurants_count, migrations.RunPython.noop
+        ),
+    ]
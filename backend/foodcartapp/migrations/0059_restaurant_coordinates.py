@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+def fill_restaurant_coordinates(apps, schema_editor):
+    Restaurant = apps.get_model("foodcartapp", "Restaurant")
+    GeoPlace = apps.get_model("geocoder_cache", "GeoPlace")
+    restaurants = list(Restaurant.objects.exclude(address=""))
+    # Адреса в кэше геокодера хранятся со схлопнутыми пробелами
+    addresses = {" ".join(restaurant.address.split()) for restaurant in restaurants}
+    places = {
+        place.address: place
+        for place in GeoPlace.objects.filter(
+            address__in=addresses, latitude__isnull=False, longitude__isnull=False
+        )
+    }
+    located_restaurants = []
+    for restaurant in restaurants:
+        place = places.get(" ".join(restaurant.address.split()))
+        if place:
+            restaurant.latitude = place.latitude
+            restaurant.longitude = place.longitude
+            restaurant.coordinates_address = restaurant.address
+            located_restaurants.append(restaurant)
+    Restaurant.objects.bulk_update(
+        located_restaurants,
+        ["latitude", "longitude", "coordinates_address"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0058_product_available_restaurants_count"),
+        ("geocoder_cache", "0005_geoplace_failure_backoff"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="restaurant",
+            name="coordinates_address",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=100,
+                verbose_name="адрес, для которого найдены координаты",
+            ),
+        ),
+        migrations.AddField(
+            model_name="restaurant",
+            name="latitude",
+            field=models.FloatField(
+                blank=True, editable=False, null=True, verbose_name="широта"
+            ),
+        ),
+        migrations.AddField(
+            model_name="restaurant",
+            name="longitude",
+            field=models.FloatField(
+                blank=True, editable=False, null=True, verbose_name="долгота"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="restaurant",
+            index=models.Index(
+                fields=["latitude", "longitude"], name="restaurant_coordinates_idx"
+            ),
+        ),
+        migrations.RunPython(fill_restaurant_coordinates, migrations.RunPython.noop),
+    ]
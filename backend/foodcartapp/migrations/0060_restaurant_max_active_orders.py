@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0059_restaurant_coordinates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="restaurant",
+            name="max_active_orders",
+            field=models.PositiveIntegerField(
+                default=20,
+                help_text="Больше заказов автоматическое назначение ресторану не отдаст",
+                verbose_name="заказов одновременно",
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("foodcartapp", "0060_restaurant_max_active_orders"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeliveryTimeStats",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "restaurant_id",
+                    models.PositiveIntegerField(
+                        help_text="0 — все рестораны", verbose_name="id ресторана"
+                    ),
+                ),
+                (
+                    "distance_bucket",
+                    models.SmallIntegerField(
+                        help_text="Номер диапазона шириной ETA_DISTANCE_BUCKET_KM км, -1 — любое расстояние",
+                        verbose_name="диапазон расстояний",
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveIntegerField(default=0, verbose_name="заказов"),
+                ),
+                (
+                    "mean_minutes",
+                    models.FloatField(
+                        default=0, verbose_name="среднее время доставки, мин"
+                    ),
+                ),
+                (
+                    "m2",
+                    models.FloatField(
+                        default=0, verbose_name="сумма квадратов отклонений"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "статистика времени доставки",
+                "verbose_name_plural": "статистика времени доставки",
+                "unique_together": {("restaurant_id", "distance_bucket")},
+            },
+        ),
+    ]
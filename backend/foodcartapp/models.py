@@ -1,9 +1,53 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from phonenumber_field.modelfields import PhoneNumberField
-from django.db.models import F, Sum
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Sum, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from decimal import Decimal
 from collections import defaultdict
+from math import sqrt
+
+from geocoder_cache.services import (
+    enqueue_geocoding,
+    get_cached_coordinates,
+    get_coordinates_batch,
+    normalize_address,
+)
+
+from .services import match_orders_with_restaurants
+
+
+class RestaurantQuerySet(models.QuerySet):
+    def with_outdated_coordinates(self):
+        """Рестораны, у которых координаты не найдены для текущего адреса."""
+        return self.exclude(coordinates_address=F('address'))
+
+    def update_coordinates(self, geocode=False):
+        """Записывает ресторанам координаты их адресов. Возвращает рестораны, оставшиеся без координат.
+
+        По умолчанию координаты берутся только из кэша геокодера, а новые адреса
+        ставятся в очередь на геокодирование. С geocode=True новые адреса сразу
+        запрашиваются у API.
+        """
+        restaurants = list(self.only('id', 'name', 'address'))
+        addresses = [normalize_address(restaurant.address) for restaurant in restaurants if restaurant.address]
+        if geocode and settings.YANDEX_GEOCODER_API_KEY:
+            coordinates = get_coordinates_batch(addresses)
+        else:
+            coordinates, pending_addresses = get_cached_coordinates(addresses)
+            enqueue_geocoding(pending_addresses)
+
+        unlocated_restaurants = []
+        for restaurant in restaurants:
+            coords = coordinates.get(normalize_address(restaurant.address)) if restaurant.address else None
+            restaurant.latitude, restaurant.longitude = coords or (None, None)
+            # Без координат адрес остаётся устаревшим, и его подхватит следующий проход
+            restaurant.coordinates_address = restaurant.address if coords else ''
+            if coords is None:
+                unlocated_restaurants.append(restaurant)
+        Restaurant.objects.bulk_update(restaurants, ['latitude', 'longitude', 'coordinates_address'])
+        return unlocated_restaurants
 
 
 class Restaurant(models.Model):
@@ -21,10 +65,38 @@ class Restaurant(models.Model):
         max_length=50,
         blank=True,
     )
+    latitude = models.FloatField(
+        'широта',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    longitude = models.FloatField(
+        'долгота',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    coordinates_address = models.CharField(
+        'адрес, для которого найдены координаты',
+        max_length=100,
+        blank=True,
+        editable=False,
+    )
+    max_active_orders = models.PositiveIntegerField(
+        'заказов одновременно',
+        default=20,
+        help_text='Больше заказов автоматическое назначение ресторану не отдаст',
+    )
+
+    objects = RestaurantQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'ресторан'
         verbose_name_plural = 'рестораны'
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='restaurant_coordinates_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -32,12 +104,34 @@ class Restaurant(models.Model):
 
 class ProductQuerySet(models.QuerySet):
     def available(self):
-        products = (
+        """Товары, которые продаются хотя бы в одном ресторане."""
+        if not settings.PRODUCT_AVAILABILITY_COUNTER:
+            return self.available_in_menus()
+        return self.filter(available_restaurants_count__gt=0)
+
+    def available_in_menus(self):
+        """То же, что available(), но по самим позициям меню, без сохранённого счётчика."""
+        menu_items = RestaurantMenuItem.objects.filter(product=OuterRef('pk'), availability=True)
+        return self.filter(Exists(menu_items))
+
+    def recalculate_available_restaurants_count(self):
+        """Пересчитывает число ресторанов, где товар в продаже.
+
+        Строки товаров сначала блокируются: иначе две параллельные транзакции,
+        меняющие меню одного товара, посчитали бы каждая без изменений другой.
+        """
+        menu_items_count = (
             RestaurantMenuItem.objects
-            .filter(availability=True)
-            .values_list('product')
+            .filter(product=OuterRef('pk'), availability=True)
+            .values('product')
+            .annotate(count=Count('pk'))
+            .values('count')
         )
-        return self.filter(pk__in=products)
+        with transaction.atomic():
+            product_ids = list(self.select_for_update().order_by('pk').values_list('pk', flat=True))
+            return Product.objects.filter(pk__in=product_ids).update(
+                available_restaurants_count=Coalesce(Subquery(menu_items_count), 0),
+            )
 
 
 class ProductCategory(models.Model):
@@ -86,6 +180,13 @@ class Product(models.Model):
         max_length=200,
         blank=True,
     )
+    available_restaurants_count = models.PositiveIntegerField(
+        'ресторанов в продаже',
+        default=0,
+        db_index=True,
+        editable=False,
+        help_text='Пересчитывается при изменении меню ресторанов',
+    )
 
     objects = ProductQuerySet.as_manager()
 
@@ -96,6 +197,15 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Счётчик меняет только пересчёт по меню, устаревшее значение из памяти не должно его затереть
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'available_restaurants_count'
+            ]
+        super().save(*args, **kwargs)
+
 
 class RestaurantMenuItem(models.Model):
     restaurant = models.ForeignKey(
@@ -126,27 +236,57 @@ class RestaurantMenuItem(models.Model):
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        menu_item = super().from_db(db, field_names, values)
+        # Если позицию перенесут на другой товар, счётчик нужно пересчитать и у прежнего
+        menu_item.loaded_product_id = menu_item.__dict__.get('product_id')
+        return menu_item
+
 
 class OrderQuerySet(models.QuerySet):
-    def with_total_cost(self):
-        return self.annotate(
-            total_cost=Sum(F('items__quantity') * F('items__price'))
+    def recalculate_total_cost(self):
+        """Пересчитывает сохранённую стоимость заказов по их позициям одним UPDATE."""
+        items_cost = (
+            OrderItem.objects
+            .filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(cost=Sum(F('quantity') * F('price')))
+            .values('cost')
         )
+        return self.update(total_cost=Coalesce(Subquery(items_cost), Decimal('0')))
 
     def with_available_restaurants(self):
         """Добавляет к каждому заказу список ресторанов, которые могут выполнить заказ. Возвращает self."""
-        menu_items = RestaurantMenuItem.objects.filter(availability=True).select_related('restaurant', 'product')
+        menu_items = (
+            RestaurantMenuItem.objects
+            .filter(availability=True)
+            .values_list('restaurant_id', 'product_id')
+        )
         restaurants_products = defaultdict(set)
-        for item in menu_items:
-            restaurants_products[item.restaurant].add(item.product)
-
-        for order in self:
-            order_products = set(order_item.product for order_item in order.items.select_related('product'))
-            available_restaurants = []
-            for restaurant, products in restaurants_products.items():
-                if order_products.issubset(products):
-                    available_restaurants.append(restaurant)
-            order.available_restaurants = available_restaurants
+        for restaurant_id, product_id in menu_items:
+            restaurants_products[restaurant_id].add(product_id)
+        restaurants = Restaurant.objects.filter(pk__in=restaurants_products).order_by('name')
+
+        orders = list(self)
+        prefetch_related_objects(
+            [order for order in orders if 'items' not in getattr(order, '_prefetched_objects_cache', {})],
+            'items',
+        )
+        orders_products = {
+            order.pk: [order_item.product_id for order_item in order.items.all()]
+            for order in orders
+        }
+
+        matches = match_orders_with_restaurants(
+            orders_products,
+            {restaurant.pk: restaurants_products[restaurant.pk] for restaurant in restaurants},
+        )
+        restaurants_by_id = {restaurant.pk: restaurant for restaurant in restaurants}
+        for order in orders:
+            order.available_restaurants = [
+                restaurants_by_id[restaurant_id] for restaurant_id in matches[order.pk]
+            ]
         return self
 
 
@@ -196,6 +336,11 @@ class Order(models.Model):
         'время создания',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'время изменения',
+        auto_now=True,
+        db_index=True,
+    )
     comment = models.TextField(
         'комментарий',
         blank=True,
@@ -213,6 +358,14 @@ class Order(models.Model):
         blank=True,
         help_text='Дата и время доставки заказа'
     )
+    total_cost = models.DecimalField(
+        'стоимость заказа',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(Decimal('0'))],
+        help_text='Сумма по позициям заказа, пересчитывается при их изменении'
+    )
     restaurant = models.ForeignKey(
         Restaurant,
         verbose_name='ресторан',
@@ -230,6 +383,7 @@ class Order(models.Model):
         verbose_name_plural = 'заказы'
         ordering = ['-created_at']
         indexes = [
+            models.Index(fields=['created_at', 'id']),
             models.Index(fields=['phonenumber']),
             models.Index(fields=['status']),
             models.Index(fields=['payment_method']),
@@ -240,6 +394,115 @@ class Order(models.Model):
     def __str__(self):
         return f"Заказ {self.pk} - {self.firstname} {self.lastname}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        order = super().from_db(db, field_names, values)
+        # Загрузка ресторанов меняется от прежних ресторана и статуса к новым
+        order.loaded_kitchen_state = (order.__dict__.get('restaurant_id'), order.__dict__.get('status'))
+        order.loaded_is_delivered = order.is_delivered()
+        return order
+
+    def is_delivered(self):
+        """Выполнен ли заказ с известными рестораном и временем доставки — такие заказы попадают в статистику доставки."""
+        return (
+            self.__dict__.get('status') == 'completed'
+            and self.__dict__.get('restaurant_id') is not None
+            and self.__dict__.get('delivered_at') is not None
+        )
+
+    def calculate_total_cost(self):
+        """Считает стоимость заказа по позициям в БД."""
+        return self.items.aggregate(
+            cost=Coalesce(Sum(F('quantity') * F('price')), Decimal('0'))
+        )['cost']
+
+
+class OrderEvent(models.Model):
+    """Запись журнала изменений заказов для живого обновления страницы менеджера"""
+
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    KIND_CHOICES = [
+        (CREATED, 'Создан'),
+        (UPDATED, 'Изменён'),
+        (DELETED, 'Удалён'),
+    ]
+
+    order_id = models.PositiveIntegerField(
+        'id заказа',
+    )
+    kind = models.CharField(
+        'тип события',
+        max_length=20,
+        choices=KIND_CHOICES,
+    )
+    payload = models.JSONField(
+        'данные',
+        default=dict,
+    )
+    created_at = models.DateTimeField(
+        'время события',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'событие заказа'
+        verbose_name_plural = 'журнал событий заказов'
+
+    def __str__(self):
+        return f"{self.get_kind_display()} заказ {self.order_id}"
+
+
+class DeliveryTimeStats(models.Model):
+    """Статистика времени доставки: от создания заказа до вручения клиенту"""
+
+    ALL_RESTAURANTS = 0
+    ANY_DISTANCE = -1
+
+    restaurant_id = models.PositiveIntegerField(
+        'id ресторана',
+        help_text='0 — все рестораны',
+    )
+    distance_bucket = models.SmallIntegerField(
+        'диапазон расстояний',
+        help_text='Номер диапазона шириной ETA_DISTANCE_BUCKET_KM км, -1 — любое расстояние',
+    )
+    count = models.PositiveIntegerField(
+        'заказов',
+        default=0,
+    )
+    mean_minutes = models.FloatField(
+        'среднее время доставки, мин',
+        default=0,
+    )
+    m2 = models.FloatField(
+        'сумма квадратов отклонений',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'статистика времени доставки'
+        verbose_name_plural = 'статистика времени доставки'
+        unique_together = [
+            ['restaurant_id', 'distance_bucket']
+        ]
+
+    def __str__(self):
+        return f"Ресторан {self.restaurant_id}, диапазон {self.distance_bucket}: {self.mean_minutes:.0f} мин"
+
+    def add(self, minutes):
+        """Учитывает ещё одну доставку, обновляя среднее и разброс за один проход (алгоритм Уэлфорда)."""
+        self.count += 1
+        delta = minutes - self.mean_minutes
+        self.mean_minutes += delta / self.count
+        self.m2 += delta * (minutes - self.mean_minutes)
+
+    @property
+    def std_minutes(self):
+        return sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(
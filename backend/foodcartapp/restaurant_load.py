@@ -0,0 +1,100 @@
+"""Загрузка кухонь ресторанов — сколько назначенных им заказов ещё не отдано курьеру.
+
+Число заказов каждого ресторана лежит в общем кэше отдельным ключом. При
+смене статуса или ресторана заказа ключи меняются на единицу через
+cache.incr, поэтому страницы менеджера не пересчитывают заказы по всей
+таблице. Ключ, которого нет в кэше, считается заново одним запросом на все
+недостающие рестораны, а таймаут не даёт накопиться расхождениям.
+
+Счётчики верны, только если incr и add атомарны. В проде CACHE_URL
+обязателен и указывает на Redis или Memcached, при разработке по умолчанию
+используется кэш в памяти процесса. С другими бэкендами, например с файловым
+кэшем, загрузка не кэшируется и каждый раз считается по БД.
+"""
+from collections import Counter
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import PyLibMCCache, PyMemcacheCache
+from django.core.cache.backends.redis import RedisCache
+from django.db.models import Count
+
+from .models import Order
+
+
+KITCHEN_STATUSES = ('new', 'confirmed', 'preparing')
+RESTAURANT_LOAD_TIMEOUT = 10 * 60
+# В LocMemCache счётчики атомарны, но у каждого процесса свои — годится для разработки и тестов
+ATOMIC_CACHE_BACKENDS = (RedisCache, PyMemcacheCache, PyLibMCCache, LocMemCache)
+
+
+def _load_key(restaurant_id):
+    return f'foodcartapp:restaurant_load:{restaurant_id}'
+
+
+def get_kitchen_restaurant_id(restaurant_id, status):
+    """Возвращает ресторан, загрузку которого увеличивает заказ, или None."""
+    return restaurant_id if status in KITCHEN_STATUSES else None
+
+
+def loads_are_cached():
+    """Проверяет, что кэш меняет счётчики атомарно и загрузку можно в нём хранить."""
+    return isinstance(caches['default'], ATOMIC_CACHE_BACKENDS)
+
+
+def count_restaurant_loads(restaurant_ids):
+    """Считает загрузку ресторанов по БД одним запросом."""
+    counted = dict(
+        Order.objects
+        .filter(restaurant_id__in=restaurant_ids, status__in=KITCHEN_STATUSES)
+        .values('restaurant_id')
+        .annotate(count=Count('pk'))
+        .values_list('restaurant_id', 'count')
+    )
+    return {restaurant_id: counted.get(restaurant_id, 0) for restaurant_id in restaurant_ids}
+
+
+def get_restaurant_loads(restaurant_ids):
+    """Возвращает {id ресторана: заказов в очереди кухни}."""
+    restaurant_ids = set(restaurant_ids)
+    if not loads_are_cached():
+        return count_restaurant_loads(restaurant_ids)
+    keys = {_load_key(restaurant_id): restaurant_id for restaurant_id in restaurant_ids}
+    loads = {keys[key]: load for key, load in cache.get_many(keys).items()}
+
+    missing_ids = restaurant_ids - loads.keys()
+    if missing_ids:
+        missing_loads = count_restaurant_loads(missing_ids)
+        # add, а не set: пока шёл подсчёт, ключ мог появиться и уже получить изменения
+        for restaurant_id, load in missing_loads.items():
+            cache.add(_load_key(restaurant_id), load, timeout=RESTAURANT_LOAD_TIMEOUT)
+        loads.update(missing_loads)
+    return loads
+
+
+def change_restaurant_loads(changes):
+    """Применяет изменения {id ресторана: на сколько заказов выросла очередь} к закэшированной загрузке."""
+    if not loads_are_cached():
+        return
+    for restaurant_id, delta in changes.items():
+        if not delta:
+            continue
+        try:
+            cache.incr(_load_key(restaurant_id), delta)
+        except ValueError:
+            # Ключа нет в кэше — его посчитают по БД при следующем чтении
+            pass
+
+
+def get_load_changes(transitions):
+    """Считает изменения загрузки по переходам заказов [((ресторан, статус) до, (ресторан, статус) после)]."""
+    changes = Counter()
+    for before, after in transitions:
+        before_restaurant_id = get_kitchen_restaurant_id(*before)
+        after_restaurant_id = get_kitchen_restaurant_id(*after)
+        if before_restaurant_id != after_restaurant_id:
+            if before_restaurant_id is not None:
+                changes[before_restaurant_id] -= 1
+            if after_restaurant_id is not None:
+                changes[after_restaurant_id] += 1
+    return changes
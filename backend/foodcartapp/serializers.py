@@ -6,13 +6,6 @@ from .models import Product, Order, OrderItem
 class OrderItemSerializer(serializers.Serializer):
     product = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
-    
-    def validate_product(self, value):
-        try:
-            Product.objects.get(id=value)
-        except Product.DoesNotExist:
-            raise serializers.ValidationError(f'Недопустимый первичный ключ "{value}"')
-        return value
 
 
 class OrderItemReadSerializer(serializers.ModelSerializer):
@@ -25,10 +18,11 @@ class OrderItemReadSerializer(serializers.ModelSerializer):
 
 class OrderReadSerializer(serializers.ModelSerializer):
     products = OrderItemReadSerializer(source='items', many=True, read_only=True)
+    eta_minutes = serializers.IntegerField(read_only=True, allow_null=True, default=None)
     
     class Meta:
         model = Order
-        fields = ['id', 'firstname', 'lastname', 'phonenumber', 'address', 'created_at', 'products']
+        fields = ['id', 'firstname', 'lastname', 'phonenumber', 'address', 'created_at', 'products', 'eta_minutes']
 
 
 class OrderSerializer(serializers.Serializer):
@@ -36,4 +30,25 @@ class OrderSerializer(serializers.Serializer):
     lastname = serializers.CharField(max_length=50)
     phonenumber = PhoneNumberField()
     address = serializers.CharField(max_length=200)
-    products = OrderItemSerializer(many=True, allow_empty=False) 
\ No newline at end of file
+    products = OrderItemSerializer(many=True, allow_empty=False)
+
+    def validate_products(self, value):
+        """Проверяет все товары корзины одним запросом и подставляет объекты Product вместо id."""
+        products = Product.objects.in_bulk({item['product'] for item in value})
+
+        errors = []
+        for item in value:
+            product_id = item['product']
+            if product_id in products:
+                errors.append({})
+            else:
+                errors.append({
+                    'product': [f'Недопустимый первичный ключ "{product_id}"'],
+                })
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return [
+            {**item, 'product': products[item['product']]}
+            for item in value
+        ]
@@ -1,5 +1,76 @@
+from django.conf import settings
 from geopy.distance import geodesic
 
+from .spatial import RestaurantIndex, to_unit_vector
+
+
+def get_products_bitmask(product_ids, product_bits):
+    """Кодирует набор товаров битовой маской по номерам из product_bits. Возвращает None, если товара нет ни в одном меню."""
+    mask = 0
+    for product_id in product_ids:
+        bit = product_bits.get(product_id)
+        if bit is None:
+            return None
+        mask |= 1 << bit
+    return mask
+
+
+def match_orders_with_restaurants(orders_products, restaurants_products):
+    """Возвращает {id заказа: [id ресторанов]}, где у ресторана в меню есть все товары заказа.
+
+    Меню ресторанов и корзины заказов кодируются битовыми масками, поэтому проверка
+    пары заказ-ресторан сводится к одной побитовой операции. Заказы с одинаковым
+    набором товаров сопоставляются с ресторанами один раз.
+    """
+    product_bits = {}
+    for products in restaurants_products.values():
+        for product_id in products:
+            product_bits.setdefault(product_id, len(product_bits))
+
+    restaurant_masks = [
+        (restaurant_id, get_products_bitmask(products, product_bits))
+        for restaurant_id, products in restaurants_products.items()
+    ]
+
+    matches_by_mask = {None: []}
+    matches = {}
+    for order_id, products in orders_products.items():
+        order_mask = get_products_bitmask(products, product_bits)
+        if order_mask not in matches_by_mask:
+            matches_by_mask[order_mask] = [
+                restaurant_id
+                for restaurant_id, restaurant_mask in restaurant_masks
+                if order_mask & ~restaurant_mask == 0
+            ]
+        matches[order_id] = matches_by_mask[order_mask]
+    return matches
+
+
+MENU_ITEM_MISSING = 0
+MENU_ITEM_UNAVAILABLE = 1
+MENU_ITEM_AVAILABLE = 2
+
+
+def build_availability_matrix(product_ids, restaurant_ids, menu_items):
+    """Строит матрицу доступности товаров в ресторанах.
+
+    menu_items — тройки (id товара, id ресторана, доступен ли). Матрица хранится
+    одним bytearray по строкам: ячейка товара i в ресторане j лежит по индексу
+    i * len(restaurant_ids) + j и содержит одно из значений MENU_ITEM_*.
+    """
+    product_indexes = {product_id: index for index, product_id in enumerate(product_ids)}
+    restaurant_indexes = {restaurant_id: index for index, restaurant_id in enumerate(restaurant_ids)}
+    width = len(restaurant_ids)
+    matrix = bytearray(len(product_ids) * width)
+    for product_id, restaurant_id, availability in menu_items:
+        product_index = product_indexes.get(product_id)
+        restaurant_index = restaurant_indexes.get(restaurant_id)
+        if product_index is not None and restaurant_index is not None:
+            matrix[product_index * width + restaurant_index] = (
+                MENU_ITEM_AVAILABLE if availability else MENU_ITEM_UNAVAILABLE
+            )
+    return matrix
+
 
 def distance_key(item):
     """Возвращает расстояние для сортировки, None заменяет на бесконечность."""
@@ -7,21 +78,122 @@ def distance_key(item):
     return float('inf') if distance is None else distance
 
 
-def get_restaurant_distances(delivery_address, restaurants, restaurant_coords, order_coords):
-    """Получает расстояния от адреса доставки до всех ресторанов, используя заранее подготовленные словари координат."""
-    distances = []
-    delivery_coords = order_coords.get(delivery_address)
+def _refine_ranking(ranked, origin, destinations, exact_top_k):
+    """Уточняет через geodesic расстояния первых exact_top_k мест и округляет все расстояния до сотых.
+
+    ranked — [(ключ, км)] по возрастанию расстояния, destinations — координаты по ключу.
+    """
+    top = ranked[:exact_top_k]
+    for position, (key, distance) in enumerate(top):
+        if distance is None:
+            break
+        top[position] = (key, geodesic(origin, destinations[key]).kilometers)
+    ranked = sorted(top, key=distance_key) + ranked[exact_top_k:]
+    return [
+        (key, None if distance is None else round(distance, 2))
+        for key, distance in ranked
+    ]
+
+
+def get_restaurant_coordinates(restaurant):
+    return restaurant.latitude, restaurant.longitude
+
+
+def estimate_delivery_minutes(distance, queued_orders):
+    """Оценивает, через сколько минут ресторан доставит заказ: очередь кухни плюс дорога курьера."""
+    return (
+        queued_orders * settings.KITCHEN_MINUTES_PER_QUEUED_ORDER
+        + distance / settings.COURIER_SPEED_KMH * 60
+    )
+
+
+def _rank_by_load(ranked, loads, limit=None):
+    """Пересортировывает [(id ресторана, км)] по оценке времени доставки с учётом очереди кухни."""
+    return sorted(ranked, key=lambda item: estimate_delivery_minutes(item[1], loads.get(item[0], 0)))[:limit]
+
+
+def _get_located_restaurant_ids(points, index):
+    """Возвращает id ресторанов, у которых есть координаты и которые уже попали в индекс."""
+    return {pk for pk, coords in points.items() if to_unit_vector(coords) is not None and pk in index}
+
+
+def get_orders_restaurant_distances(
+    orders, order_coords, exact_top_k=None, limit=None, max_km=None, loads=None, index=None,
+):
+    """Добавляет к заказам restaurant_distances — ближайшие из доступных ресторанов с расстояниями до адреса доставки.
+
+    Рестораны ищутся по пространственному индексу index, а без него — по
+    индексу, построенному только из доступных ресторанов: не больше limit
+    ближайших в пределах max_km. С loads — {id ресторана: заказов в очереди кухни} —
+    из NEAREST_RESTAURANTS_CANDIDATES ближайших выбираются limit, которые
+    быстрее доставят заказ с учётом очереди. Рестораны, координаты которых ещё
+    не известны, идут в конце с расстоянием None.
+    """
+    if exact_top_k is None:
+        exact_top_k = settings.DISTANCE_EXACT_TOP_K
+    if limit is None:
+        limit = settings.NEAREST_RESTAURANTS_LIMIT
+    if max_km is None:
+        max_km = settings.NEAREST_RESTAURANTS_MAX_KM
+
+    restaurants = {
+        restaurant.pk: restaurant
+        for order in orders
+        for restaurant in order.available_restaurants
+    }
+    points = {pk: get_restaurant_coordinates(restaurant) for pk, restaurant in restaurants.items()}
+    if index is None:
+        index = RestaurantIndex(points)
+    located_ids = _get_located_restaurant_ids(points, index)
+
+    for order in orders:
+        coords = order_coords.get(order.address)
+        if not coords:
+            order.restaurant_distances = [(restaurant, None) for restaurant in order.available_restaurants]
+            continue
+        nearest = index.nearest(
+            coords,
+            k=limit if loads is None else max(limit, settings.NEAREST_RESTAURANTS_CANDIDATES),
+            max_km=max_km,
+            keys={restaurant.pk for restaurant in order.available_restaurants} & located_ids,
+        )
+        ranked = _refine_ranking(nearest, coords, points, exact_top_k)
+        if loads is not None:
+            ranked = _rank_by_load(ranked, loads, limit)
+        order.restaurant_distances = [
+            (restaurants[pk], distance) for pk, distance in ranked
+        ] + [
+            (restaurant, None)
+            for restaurant in order.available_restaurants
+            if restaurant.pk not in located_ids
+        ]
+    return orders
+
+
+def get_restaurant_distances(delivery_coords, restaurants, loads=None, index=None):
+    """Получает расстояния от точки доставки до всех ресторанов.
+
+    Рестораны ищутся по индексу index, а без него — по индексу только из
+    переданных ресторанов. Рестораны отсортированы по расстоянию, а с loads —
+    по оценке времени доставки с учётом очереди кухни.
+    """
     if not delivery_coords:
         return []
-    for restaurant in restaurants:
-        rest_coords = restaurant_coords.get(restaurant.address)
-        if rest_coords and rest_coords[0] is not None and rest_coords[1] is not None:
-            try:
-                distance = geodesic(delivery_coords, rest_coords).kilometers
-                distances.append((restaurant, round(distance, 2)))
-            except ValueError:
-                distances.append((restaurant, None))
-        else:
-            distances.append((restaurant, None))
-    distances.sort(key=distance_key)
-    return distances 
\ No newline at end of file
+    restaurants = {restaurant.pk: restaurant for restaurant in restaurants}
+    points = {pk: get_restaurant_coordinates(restaurant) for pk, restaurant in restaurants.items()}
+    if index is None:
+        index = RestaurantIndex(points)
+    located_ids = _get_located_restaurant_ids(points, index)
+    ranked = _refine_ranking(
+        index.nearest(delivery_coords, keys=located_ids),
+        delivery_coords,
+        points,
+        settings.DISTANCE_EXACT_TOP_K,
+    )
+    if loads is not None:
+        ranked = _rank_by_load(ranked, loads)
+    return [(restaurants[pk], distance) for pk, distance in ranked] + [
+        (restaurant, None)
+        for pk, restaurant in restaurants.items()
+        if pk not in located_ids
+    ]
@@ -0,0 +1,134 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from geocoder_cache.services import normalize_address
+from geocoder_cache.signals import places_changed
+from star_burger.metrics import ORDERS_CREATED
+
+from .caching import CATALOG_NAMESPACE, RESTAURANTS_NAMESPACE, bump_version
+from .eta import record_delivery
+from .models import Order, OrderEvent, Product, ProductCategory, Restaurant, RestaurantMenuItem
+from .restaurant_load import change_restaurant_loads, get_load_changes
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductCategory)
+@receiver([post_save, post_delete], sender=RestaurantMenuItem)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, CATALOG_NAMESPACE))
+
+
+@receiver([post_save, post_delete], sender=RestaurantMenuItem)
+def update_product_availability(sender, instance, **kwargs):
+    product_ids = {instance.product_id, getattr(instance, 'loaded_product_id', None)} - {None}
+    Product.objects.filter(pk__in=product_ids).recalculate_available_restaurants_count()
+    instance.loaded_product_id = instance.product_id
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def invalidate_restaurants(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, RESTAURANTS_NAMESPACE))
+
+
+@receiver(post_save, sender=Restaurant)
+def update_changed_restaurant_coordinates(sender, instance, **kwargs):
+    if instance.coordinates_address != instance.address:
+        restaurants = Restaurant.objects.filter(pk=instance.pk)
+        transaction.on_commit(partial(update_coordinates, restaurants))
+
+
+@receiver(places_changed)
+def update_restaurants_coordinates(sender, addresses, **kwargs):
+    addresses = set(addresses)
+    restaurant_ids = [
+        restaurant_id
+        for restaurant_id, address in Restaurant.objects.values_list('id', 'address')
+        if normalize_address(address) in addresses
+    ]
+    if restaurant_ids:
+        update_coordinates(Restaurant.objects.filter(pk__in=restaurant_ids))
+
+
+def update_coordinates(restaurants):
+    restaurants.update_coordinates()
+    # bulk_update не шлёт сигналы, а координаты ресторанов входят в их индекс
+    transaction.on_commit(partial(bump_version, RESTAURANTS_NAMESPACE))
+
+
+def dump_order_event_payload(order):
+    return {
+        'id': order.id,
+        'firstname': order.firstname,
+        'lastname': order.lastname,
+        'phonenumber': str(order.phonenumber),
+        'address': order.address,
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'payment_method_display': order.get_payment_method_display(),
+        'comment': order.comment,
+        'total_cost': str(order.total_cost),
+        'restaurant': {
+            'id': order.restaurant.id,
+            'name': order.restaurant.name,
+        } if order.restaurant else None,
+    }
+
+
+@receiver(post_save, sender=Order)
+def count_created_order(sender, instance, created, **kwargs):
+    # Заказ из откаченной транзакции не должен попасть в метрику
+    if created:
+        transaction.on_commit(ORDERS_CREATED.inc)
+
+
+@receiver(post_save, sender=Order)
+def log_order_saved(sender, instance, created, **kwargs):
+    OrderEvent.objects.create(
+        order_id=instance.pk,
+        kind=OrderEvent.CREATED if created else OrderEvent.UPDATED,
+        payload=dump_order_event_payload(instance),
+    )
+
+
+@receiver(post_save, sender=Order)
+def update_restaurant_load(sender, instance, created, **kwargs):
+    before = (None, None) if created else getattr(instance, 'loaded_kitchen_state', (None, None))
+    after = (instance.restaurant_id, instance.status)
+    changes = get_load_changes([(before, after)])
+    if changes:
+        transaction.on_commit(partial(change_restaurant_loads, changes))
+    instance.loaded_kitchen_state = after
+
+
+@receiver(post_save, sender=Order)
+def record_delivery_time(sender, instance, created, **kwargs):
+    is_delivered = instance.is_delivered()
+    if is_delivered and (created or not getattr(instance, 'loaded_is_delivered', False)):
+        transaction.on_commit(partial(
+            record_delivery,
+            instance.restaurant_id,
+            instance.address,
+            instance.created_at,
+            instance.delivered_at,
+        ))
+    instance.loaded_is_delivered = is_delivered
+
+
+@receiver(post_delete, sender=Order)
+def release_restaurant_load(sender, instance, **kwargs):
+    before = getattr(instance, 'loaded_kitchen_state', (instance.restaurant_id, instance.status))
+    changes = get_load_changes([(before, (None, None))])
+    if changes:
+        transaction.on_commit(partial(change_restaurant_loads, changes))
+
+
+@receiver(post_delete, sender=Order)
+def log_order_deleted(sender, instance, **kwargs):
+    OrderEvent.objects.create(
+        order_id=instance.pk,
+        kind=OrderEvent.DELETED,
+        payload={'id': instance.pk},
+    )
@@ -0,0 +1,123 @@
+import heapq
+from math import asin, cos, pi, radians, sin, sqrt
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vector(coords):
+    """Переводит (lat, lng) в точку на единичной сфере. Возвращает None для пустых и неверных координат."""
+    if not coords or coords[0] is None or coords[1] is None:
+        return None
+    latitude, longitude = coords
+    if not (-90 <= latitude <= 90):
+        return None
+    latitude, longitude = radians(latitude), radians(longitude)
+    return (
+        cos(latitude) * cos(longitude),
+        cos(latitude) * sin(longitude),
+        sin(latitude),
+    )
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, chord / 2))
+
+
+def km_to_chord(distance):
+    return 2 * sin(min(distance / EARTH_RADIUS_KM, pi) / 2)
+
+
+def distance_km(first, second):
+    """Расстояние между точками (lat, lng) по поверхности Земли. None, если координаты одной из них неизвестны."""
+    first, second = to_unit_vector(first), to_unit_vector(second)
+    if first is None or second is None:
+        return None
+    return chord_to_km(sqrt(sum((a - b) ** 2 for a, b in zip(first, second))))
+
+
+class RestaurantIndex:
+    """k-d дерево по координатам ресторанов.
+
+    Точки хранятся как векторы на единичной сфере: длина хорды между ними
+    растёт вместе с расстоянием по поверхности Земли, поэтому ближайшие по
+    хорде рестораны — ближайшие и по карте, без искажений у полюсов и на
+    180-м меридиане.
+    """
+
+    def __init__(self, points):
+        """points — {id ресторана: (lat, lng)}. Рестораны без координат в индекс не попадают."""
+        items = []
+        for key, coords in points.items():
+            vector = to_unit_vector(coords)
+            if vector is not None:
+                items.append((vector, key))
+        self.keys = frozenset(key for _, key in items)
+        self.root = self._build(items, 0)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def _build(self, items, axis):
+        if not items:
+            return None
+        items.sort(key=lambda item: item[0][axis])
+        middle = len(items) // 2
+        vector, key = items[middle]
+        next_axis = (axis + 1) % 3
+        return (
+            vector,
+            key,
+            axis,
+            self._build(items[:middle], next_axis),
+            self._build(items[middle + 1:], next_axis),
+        )
+
+    def nearest(self, coords, k=None, max_km=None, keys=None):
+        """Возвращает до k ближайших ресторанов не дальше max_km как [(id ресторана, км)] по возрастанию расстояния.
+
+        keys ограничивает поиск этими ресторанами. Без k возвращаются все
+        подходящие рестораны в пределах max_km.
+        """
+        origin = to_unit_vector(coords)
+        if origin is None or self.root is None or k == 0:
+            return []
+        max_chord_squared = km_to_chord(max_km) ** 2 if max_km is not None else float('inf')
+
+        # Куча из (-квадрат хорды, id): на вершине самый дальний из найденных
+        found = []
+
+        def bound():
+            if k is not None and len(found) == k:
+                return min(-found[0][0], max_chord_squared)
+            return max_chord_squared
+
+        def visit(node):
+            vector, key, axis, left, right = node
+            chord_squared = (
+                (vector[0] - origin[0]) ** 2
+                + (vector[1] - origin[1]) ** 2
+                + (vector[2] - origin[2]) ** 2
+            )
+            if chord_squared <= bound() and (keys is None or key in keys):
+                if k is not None and len(found) == k:
+                    heapq.heapreplace(found, (-chord_squared, key))
+                else:
+                    heapq.heappush(found, (-chord_squared, key))
+
+            difference = origin[axis] - vector[axis]
+            near, far = (left, right) if difference < 0 else (right, left)
+            if near is not None:
+                visit(near)
+            if far is not None and difference ** 2 <= bound():
+                visit(far)
+
+        visit(self.root)
+        return sorted(
+            ((key, chord_to_km(sqrt(-negative_chord_squared))) for negative_chord_squared, key in found),
+            key=lambda item: item[1],
+        )
+
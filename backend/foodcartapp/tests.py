@@ -0,0 +1,285 @@
+import random
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from geocoder_cache.cache import local_cache
+from geocoder_cache.models import GeoPlace
+
+from .caching import get_restaurant_index
+from .models import Order, OrderItem, Product, ProductCategory, Restaurant, RestaurantMenuItem
+from .spatial import RestaurantIndex, distance_km
+
+
+@override_settings(QUERY_BUDGET_MODE='raise', GEOCODER_BACKGROUND_WORKER=False)
+class RegisterOrderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = Product.objects.bulk_create(
+            Product(name=f'Бургер {number}', price=100 + number, image='burger.jpg')
+            for number in range(100)
+        )
+        cls.restaurant = Restaurant.objects.create(name='Star Burger Арбат', latitude=55.751426, longitude=37.596183)
+        RestaurantMenuItem.objects.bulk_create(
+            RestaurantMenuItem(restaurant=cls.restaurant, product=product)
+            for product in cls.products
+        )
+        GeoPlace.objects.create(address='Москва, Арбат, 12', latitude=55.751, longitude=37.595)
+
+    def post_order(self, products):
+        return self.client.post(
+            reverse('foodcartapp:register_order'),
+            {
+                'firstname': 'Иван',
+                'lastname': 'Иванов',
+                'phonenumber': '+79291000000',
+                'address': 'Москва, Арбат, 12',
+                'products': products,
+            },
+            content_type='application/json',
+        )
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        for size in [1, 10, 100]:
+            # Координаты адреса, загрузка и индекс ресторанов каждый раз читаются из БД, а не из кэша
+            cache.clear()
+            local_cache.clear()
+            with self.subTest(size=size), self.assertNumQueries(12):
+                response = self.post_order([
+                    {'product': product.pk, 'quantity': 2}
+                    for product in self.products[:size]
+                ])
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['products']), size)
+            self.assertEqual(OrderItem.objects.filter(order_id=response.json()['id']).count(), size)
+
+    def test_unknown_product_is_reported_by_position(self):
+        response = self.post_order([
+            {'product': self.products[0].pk, 'quantity': 1},
+            {'product': 100500, 'quantity': 1},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {'products': [{}, {'product': ['Недопустимый первичный ключ "100500"']}]},
+        )
+        self.assertFalse(Order.objects.exists())
+
+
+class ProductListApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = ProductCategory.objects.create(name='Бургеры')
+            self.product = Product.objects.create(
+                name='Чизбургер', category=self.category, price=100, image='burger.jpg',
+            )
+            restaurant = Restaurant.objects.create(name='Star Burger Арбат')
+            self.menu_item = RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.product)
+
+    def get_catalog(self, **headers):
+        return self.client.get(reverse('foodcartapp:product_list_api'), headers=headers)
+
+    def test_unchanged_catalog_is_not_sent_again(self):
+        response = self.get_catalog()
+        etag = response['ETag']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in response.json()], ['Чизбургер'])
+
+        response = self.get_catalog(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_catalog_changes_are_sent_with_new_etag(self):
+        def rename_product():
+            self.product.name = 'Двойной чизбургер'
+            self.product.save()
+
+        def rename_category():
+            self.category.name = 'Бургеры и роллы'
+            self.category.save()
+
+        def remove_from_menu():
+            self.menu_item.availability = False
+            self.menu_item.save()
+
+        changes = [
+            (rename_product, lambda catalog: catalog[0]['name'] == 'Двойной чизбургер'),
+            (rename_category, lambda catalog: catalog[0]['category']['name'] == 'Бургеры и роллы'),
+            (remove_from_menu, lambda catalog: catalog == []),
+        ]
+        etag = self.get_catalog()['ETag']
+        for change, is_applied in changes:
+            with self.subTest(change.__name__):
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+
+                response = self.get_catalog(If_None_Match=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+                self.assertTrue(is_applied(response.json()))
+                etag = response['ETag']
+
+
+class RestaurantIndexTest(SimpleTestCase):
+    def setUp(self):
+        generator = random.Random(1)
+        self.points = {
+            key: (generator.uniform(-80, 80), generator.uniform(-180, 180))
+            for key in range(200)
+        }
+        # Рестораны по обе стороны 180-го меридиана
+        for key in range(200, 240):
+            longitude = generator.uniform(179, 180) * generator.choice([-1, 1])
+            self.points[key] = (generator.uniform(-5, 5), longitude)
+        self.points.update({240: None, 241: (None, None), 242: (55.75, None)})
+        self.index = RestaurantIndex(self.points)
+        self.origins = [(generator.uniform(-80, 80), generator.uniform(-180, 180)) for _ in range(20)]
+        self.origins += [(0, 180), (0, -179.9), (1, 179.5)]
+
+    def brute_force(self, origin, k=None, max_km=None, keys=None):
+        distances = sorted(
+            (distance_km(origin, coords), key)
+            for key, coords in self.points.items()
+            if distance_km(origin, coords) is not None and (keys is None or key in keys)
+        )
+        if max_km is not None:
+            distances = [(distance, key) for distance, key in distances if distance <= max_km]
+        return [(key, distance) for distance, key in distances[:k]]
+
+    def assert_same_neighbours(self, found, expected):
+        self.assertEqual([key for key, _ in found], [key for key, _ in expected])
+        for (_, found_distance), (_, expected_distance) in zip(found, expected):
+            self.assertAlmostEqual(found_distance, expected_distance, places=6)
+
+    def test_matches_brute_force(self):
+        keys = set(range(0, 242, 3))
+        cases = [
+            {},
+            {'k': 1},
+            {'k': 5},
+            {'max_km': 3000},
+            {'k': 5, 'max_km': 500},
+            {'k': 5, 'keys': keys},
+            {'k': 10, 'max_km': 5000, 'keys': keys},
+        ]
+        for origin in self.origins:
+            for params in cases:
+                with self.subTest(origin=origin, **params):
+                    self.assert_same_neighbours(
+                        self.index.nearest(origin, **params),
+                        self.brute_force(origin, **params),
+                    )
+
+    def test_points_without_coordinates_are_skipped(self):
+        self.assertEqual(len(self.index), 240)
+        self.assertEqual(self.index.nearest(None), [])
+        self.assertEqual(self.index.nearest((55.75, None), k=3), [])
+
+    def test_neighbours_across_antimeridian(self):
+        nearest = self.index.nearest((0, 179.99), k=3)
+
+        self.assertTrue(all(distance < 200 for _, distance in nearest))
+        self.assertTrue(any(self.points[key][1] < 0 for key, _ in self.index.nearest((0, 179.99), k=10)))
+
+
+class RestaurantIndexCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_index_is_rebuilt_only_after_restaurants_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant = Restaurant.objects.create(
+                name='Star Burger Арбат', latitude=55.751426, longitude=37.596183,
+            )
+            Restaurant.objects.create(name='Star Burger Без адреса')
+        index = get_restaurant_index()
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_restaurant_index(), index)
+        self.assertEqual(len(index), 1)
+
+        restaurant.latitude, restaurant.longitude = 59.93863, 30.31413
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant.save()
+
+        [(key, distance)] = get_restaurant_index().nearest((59.9386, 30.3141))
+        self.assertEqual(key, restaurant.pk)
+        self.assertLess(distance, 1)
+
+
+class GenerateLoadDataTest(TestCase):
+    def generate(self, **options):
+        call_command('generate_load_data', addresses=5, seed=1, stdout=StringIO(), **options)
+
+    def test_orders_fit_small_catalog(self):
+        self.generate(restaurants=2, categories=1, products=2, orders=50, max_items=6)
+
+        self.assertEqual(Order.objects.count(), 50)
+        self.assertLessEqual(max(order.items.count() for order in Order.objects.all()), 2)
+
+    def test_orders_without_restaurants_or_products_are_rejected(self):
+        for options in [{'restaurants': 0, 'products': 5}, {'restaurants': 2, 'products': 0}]:
+            with self.subTest(**options), self.assertRaises(CommandError):
+                self.generate(categories=1, orders=10, **options)
+
+        self.assertFalse(Restaurant.objects.exists())
+
+
+class OrderTotalCostTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Чизбургер', price=100, image='burger.jpg')
+        cls.order = Order.objects.create(
+            firstname='Иван', lastname='Иванов', phonenumber='+79291000000', address='Москва, Арбат, 12',
+        )
+        cls.item = OrderItem.objects.create(order=cls.order, product=cls.product, quantity=2, price=100)
+
+    def recalculate(self, **options):
+        call_command('recalculate_order_totals', stdout=StringIO(), **options)
+
+    def test_command_fixes_total_cost_and_updated_at(self):
+        updated_at = timezone.now() - timedelta(hours=1)
+        Order.objects.filter(pk=self.order.pk).update(total_cost=0, updated_at=updated_at)
+
+        self.recalculate(check=True)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total_cost, 0)
+
+        self.recalculate(chunk_size=1)
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.total_cost, 200)
+        self.assertGreater(order.updated_at, updated_at)
+
+    def test_admin_recalculates_total_cost_after_inline_changes(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        Order.objects.filter(pk=self.order.pk).update(total_cost=200)
+
+        response = self.client.post(reverse('admin:foodcartapp_order_change', args=[self.order.pk]), {
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': '+79291000000',
+            'address': 'Москва, Арбат, 12',
+            'status': 'new',
+            'payment_method': '',
+            'items-TOTAL_FORMS': 2,
+            'items-INITIAL_FORMS': 1,
+            'items-0-id': self.item.pk,
+            'items-0-order': self.order.pk,
+            'items-0-product': self.product.pk,
+            'items-0-quantity': 3,
+            'items-1-order': self.order.pk,
+            'items-1-product': self.product.pk,
+            'items-1-quantity': 1,
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total_cost, 400)
@@ -1,15 +1,27 @@
 import json
+from functools import partial
+
 from django.templatetags.static import static
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from django.views.decorators.cache import cache_control
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from phonenumber_field.phonenumber import to_python
 
-from .models import Product, Order, OrderItem
+from geocoder_cache.services import enqueue_geocoding
+from star_burger.query_budget import query_budget
+
+from .caching import get_catalog_snapshot
+from .eta import predict_new_order_minutes
+from .models import Order, OrderItem
 from .serializers import OrderSerializer, OrderReadSerializer
 
 
+@cache_control(public=True, max_age=60 * 60)
 @api_view(['GET'])
 def banners_list_api(request):
     # FIXME move data to db?
@@ -32,32 +44,22 @@ def banners_list_api(request):
     ])
 
 
+# Браузер всегда перепроверяет каталог по ETag, а сервер отвечает 304 из кэша
+@query_budget(5)
+@cache_control(public=True, no_cache=True)
 @api_view(['GET'])
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
+    content, etag = get_catalog_snapshot()
 
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
-        }
-        dumped_products.append(dumped_product)
-    return Response(dumped_products)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
 
 
+@query_budget(15)
 @api_view(['POST'])
 def register_order(request):
     serializer = OrderSerializer(data=request.data)
@@ -65,22 +67,39 @@ def register_order(request):
     
     validated_data = serializer.validated_data
     
+    total_cost = sum(
+        product_data['product'].price * product_data['quantity']
+        for product_data in validated_data['products']
+    )
+
     with transaction.atomic():
         order = Order.objects.create(
             firstname=validated_data['firstname'],
             lastname=validated_data['lastname'], 
             phonenumber=validated_data['phonenumber'],
-            address=validated_data['address']
+            address=validated_data['address'],
+            total_cost=total_cost
         )
-        
-        for product_data in validated_data['products']:
-            product = Product.objects.get(id=product_data['product'])
-            OrderItem.objects.create(
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                product=product,
+                product=product_data['product'],
                 quantity=product_data['quantity'],
-                price=product.price
+                price=product_data['product'].price
             )
-    
+            for product_data in validated_data['products']
+        ])
+
+        transaction.on_commit(partial(enqueue_geocoding, [order.address]))
+
+    order.eta_minutes = predict_new_order_minutes(
+        order.address,
+        [product_data['product'].id for product_data in validated_data['products']],
+    )
+    prefetch_related_objects(
+        [order],
+        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+    )
     order_serializer = OrderReadSerializer(order)
     return Response(order_serializer.data)
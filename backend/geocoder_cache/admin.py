@@ -1,11 +1,38 @@
 from django.contrib import admin
-from .models import GeoPlace
+from .cache import invalidate_places
+from .models import GeoPlace, GeocodingTask
+from .signals import places_changed
 
 
 @admin.register(GeoPlace)
 class GeoPlaceAdmin(admin.ModelAdmin):
-    list_display = ['address', 'latitude', 'longitude', 'requested_at']
-    list_filter = ['requested_at']
+    list_display = ['address', 'latitude', 'longitude', 'requested_at', 'failure_reason', 'next_retry_at']
+    list_filter = ['requested_at', 'failure_reason']
     search_fields = ['address']
     readonly_fields = ['requested_at']
     ordering = ['-requested_at']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        addresses = [address for address in [obj.address, form.initial.get('address')] if address]
+        invalidate_places(addresses)
+        places_changed.send(sender=GeoPlace, addresses=addresses)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_places([obj.address])
+        places_changed.send(sender=GeoPlace, addresses=[obj.address])
+
+    def delete_queryset(self, request, queryset):
+        addresses = list(queryset.values_list('address', flat=True))
+        super().delete_queryset(request, queryset)
+        invalidate_places(addresses)
+        places_changed.send(sender=GeoPlace, addresses=addresses)
+
+
+@admin.register(GeocodingTask)
+class GeocodingTaskAdmin(admin.ModelAdmin):
+    list_display = ['address', 'created_at']
+    search_fields = ['address']
+    readonly_fields = ['created_at']
+    ordering = ['created_at']
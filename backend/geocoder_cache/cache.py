@@ -0,0 +1,189 @@
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from star_burger.metrics import GEOCODER_CACHE_LOOKUPS
+
+from .models import GeoPlace
+
+
+GENERATION_KEY = 'geocoder_cache:generation'
+
+
+class CachedPlace(namedtuple('CachedPlace', ['latitude', 'longitude', 'next_retry_at'])):
+    """Запись кэша координат. Для ненайденных адресов координаты None."""
+
+    __slots__ = ()
+
+    @property
+    def coordinates(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
+    def is_retry_due(self, now):
+        return self.coordinates is None and self.next_retry_at is not None and self.next_retry_at <= now
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш ограниченного размера с временем жизни записей."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """Возвращает {ключ: значение} для найденных и не просроченных ключей."""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None:
+                    continue
+                value, expires_at = item
+                if expires_at < now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, mapping):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (value, expires_at)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+local_cache = LRUCache(settings.GEOCODER_LOCAL_CACHE_SIZE, settings.GEOCODER_LOCAL_CACHE_TTL)
+stats = Counter()
+_stats_lock = threading.Lock()
+_local_generation = None
+
+
+def _shared_key(address):
+    return 'geocoder_cache:place:' + hashlib.sha1(address.encode()).hexdigest()
+
+
+def _count(**increments):
+    with _stats_lock:
+        stats.update(increments)
+    for result, increment in increments.items():
+        GEOCODER_CACHE_LOOKUPS.labels(result).inc(increment)
+
+
+def _sync_generation():
+    """Сбрасывает локальный кэш процесса, если место было изменено в другом процессе."""
+    global _local_generation
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # После очистки общего кэша поколение не должно совпасть с прежним
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    if generation != _local_generation:
+        local_cache.clear()
+        _local_generation = generation
+
+
+def get_places(addresses):
+    """Возвращает {адрес: CachedPlace} для мест, которые уже запрашивались у геокодера.
+
+    Адреса должны быть нормализованы. Поиск идёт по локальному LRU-кэшу процесса,
+    затем по общему кэшу Django и только потом по таблице GeoPlace. Адресов,
+    которых нет нигде, в результате нет.
+    """
+    addresses = set(addresses)
+    if not addresses:
+        return {}
+    _sync_generation()
+
+    places = local_cache.get_many(addresses)
+    _count(local_hits=len(places))
+
+    missing = addresses - places.keys()
+    if missing:
+        shared_keys = {_shared_key(address): address for address in missing}
+        shared_places = {
+            shared_keys[key]: value
+            for key, value in cache.get_many(shared_keys).items()
+        }
+        _count(shared_hits=len(shared_places))
+        local_cache.set_many(shared_places)
+        places.update(shared_places)
+        missing -= shared_places.keys()
+
+    if missing:
+        db_places = {
+            address: CachedPlace(latitude, longitude, next_retry_at)
+            for address, latitude, longitude, next_retry_at in (
+                GeoPlace.objects
+                .filter(address__in=missing)
+                .values_list('address', 'latitude', 'longitude', 'next_retry_at')
+            )
+        }
+        _count(db_hits=len(db_places), misses=len(missing) - len(db_places))
+        set_places(db_places)
+        places.update(db_places)
+
+    return places
+
+
+def set_places(places):
+    """Записывает {адрес: CachedPlace} в оба уровня кэша."""
+    if not places:
+        return
+    local_cache.set_many(places)
+    cache.set_many(
+        {_shared_key(address): coords for address, coords in places.items()},
+        timeout=settings.GEOCODER_SHARED_CACHE_TTL,
+    )
+
+
+def invalidate_places(addresses):
+    """Удаляет адреса из общего кэша и сбрасывает локальные кэши всех процессов."""
+    addresses = [address for address in addresses if address]
+    local_cache.delete_many(addresses)
+    cache.delete_many([_shared_key(address) for address in addresses])
+    bump_generation()
+
+
+def bump_generation():
+    """Сбрасывает локальные кэши всех процессов, не трогая общий кэш."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def get_cache_stats():
+    """Возвращает счётчики попаданий в кэш координат текущего процесса."""
+    with _stats_lock:
+        return {
+            'local_hits': stats['local_hits'],
+            'shared_hits': stats['shared_hits'],
+            'db_hits': stats['db_hits'],
+            'misses': stats['misses'],
+            'local_size': len(local_cache),
+        }
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from geocoder_cache.services import process_geocoding_queue
+
+
+class Command(BaseCommand):
+    help = 'Геокодирует адреса из очереди геокодирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Не завершаться, а проверять очередь каждые --interval секунд',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Пауза между проверками очереди в режиме --loop',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_geocoding_queue()
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f'Обработано адресов: {processed}'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geocoder_cache', '0003_rename_geocodercache_geoplace_alter_geoplace_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodingTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=200, unique=True, verbose_name='адрес')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='дата постановки в очередь')),
+            ],
+            options={
+                'verbose_name': 'задача геокодирования',
+                'verbose_name_plural': 'очередь геокодирования',
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:26
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def schedule_retry_for_failed_places(apps, schema_editor):
+    """Раньше неудачи сохранялись навсегда: даём таким адресам ещё одну попытку."""
+    GeoPlace = apps.get_model("geocoder_cache", "GeoPlace")
+    GeoPlace.objects.filter(latitude__isnull=True).update(
+        failure_reason="request_failed",
+        failed_attempts=1,
+        next_retry_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("geocoder_cache", "0004_geocodingtask"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="geoplace",
+            name="failed_attempts",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="неудачных попыток подряд"
+            ),
+        ),
+        migrations.AddField(
+            model_name="geoplace",
+            name="failure_reason",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("not_found", "Адрес не найден"),
+                    ("request_failed", "Ошибка запроса"),
+                ],
+                help_text="Почему не удалось получить координаты при последнем запросе",
+                max_length=20,
+                verbose_name="причина неудачи",
+            ),
+        ),
+        migrations.AddField(
+            model_name="geoplace",
+            name="next_retry_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                help_text="Не раньше этого времени адрес будет запрошен у геокодера повторно",
+                null=True,
+                verbose_name="следующая попытка",
+            ),
+        ),
+        migrations.RunPython(
+            schedule_retry_for_failed_places, migrations.RunPython.noop
+        ),
+    ]
@@ -3,6 +3,13 @@ from django.db import models
 
 class GeoPlace(models.Model):
     """Географическое место с адресом и координатами"""
+
+    NOT_FOUND = 'not_found'
+    REQUEST_FAILED = 'request_failed'
+    FAILURE_CHOICES = [
+        (NOT_FOUND, 'Адрес не найден'),
+        (REQUEST_FAILED, 'Ошибка запроса'),
+    ]
     
     address = models.CharField(
         'адрес',
@@ -23,6 +30,24 @@ class GeoPlace(models.Model):
         'дата запроса',
         auto_now_add=True,
     )
+    failure_reason = models.CharField(
+        'причина неудачи',
+        max_length=20,
+        choices=FAILURE_CHOICES,
+        blank=True,
+        help_text='Почему не удалось получить координаты при последнем запросе',
+    )
+    failed_attempts = models.PositiveIntegerField(
+        'неудачных попыток подряд',
+        default=0,
+    )
+    next_retry_at = models.DateTimeField(
+        'следующая попытка',
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='Не раньше этого времени адрес будет запрошен у геокодера повторно',
+    )
 
     class Meta:
         verbose_name = 'географическое место'
@@ -34,3 +59,25 @@ class GeoPlace(models.Model):
 
     def __str__(self):
         return f"{self.address} ({self.latitude}, {self.longitude})"
+
+
+class GeocodingTask(models.Model):
+    """Адрес, ожидающий фонового геокодирования"""
+
+    address = models.CharField(
+        'адрес',
+        max_length=200,
+        unique=True,
+    )
+    created_at = models.DateTimeField(
+        'дата постановки в очередь',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'задача геокодирования'
+        verbose_name_plural = 'очередь геокодирования'
+
+    def __str__(self):
+        return self.address
@@ -1,50 +1,295 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
 import requests
 from django.conf import settings
-from .models import GeoPlace
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from star_burger.metrics import GEOCODER_API_DURATION
+
+from .cache import CachedPlace, bump_generation, get_places, set_places
+from .models import GeoPlace, GeocodingTask
+from .signals import places_changed
+
+
+GEOCODING_QUEUE_BATCH_SIZE = 50
+
+
+class TokenBucket:
+    """Ограничивает частоту запросов: не больше rate в секунду с запасом capacity.
+
+    Состояние хранится в памяти, поэтому у каждого процесса свой лимит.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Забирает токен, при необходимости дожидаясь его появления."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_session = None
+_rate_limiter = None
+_background_executor = None
+_lock = threading.Lock()
+
+
+def get_session():
+    """Возвращает общую для потоков HTTP-сессию с пулом keep-alive соединений."""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=settings.YANDEX_GEOCODER_MAX_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    with _lock:
+        if _rate_limiter is None:
+            _rate_limiter = TokenBucket(settings.YANDEX_GEOCODER_RATE_LIMIT)
+    return _rate_limiter
+
+
+def normalize_address(address):
+    return ' '.join(address.split())
+
+
+def get_cached_coordinates(addresses):
+    """Возвращает координаты адресов из кэша или БД, не обращаясь к API.
+
+    Результат — пара ({адрес: (lat, lng)}, [адреса, которые ещё предстоит геокодировать]).
+    Во второй список попадают новые адреса и адреса, для которых подошло время
+    повторной попытки. Ключи и список совпадают с переданными адресами.
+    """
+    addresses = [address for address in addresses if address]
+    normalized = {address: normalize_address(address) for address in addresses}
+    places = get_places(normalized.values())
+    now = timezone.now()
+
+    coordinates = {}
+    pending_addresses = []
+    for address, normalized_address in normalized.items():
+        place = places.get(normalized_address)
+        if place is None or place.is_retry_due(now):
+            pending_addresses.append(address)
+        elif place.coordinates:
+            coordinates[address] = place.coordinates
+    return coordinates, pending_addresses
+
+
+def get_retry_delay(failed_attempts):
+    """Возвращает паузу перед следующей попыткой: экспоненциально растёт с числом неудач."""
+    delay = settings.GEOCODER_RETRY_BASE_DELAY * 2 ** (failed_attempts - 1)
+    return timedelta(seconds=min(delay, settings.GEOCODER_RETRY_MAX_DELAY))
+
+
+def enqueue_geocoding(addresses):
+    """Ставит адреса в очередь на геокодирование и будит фоновый обработчик очереди."""
+    tasks = [
+        GeocodingTask(address=address)
+        for address in {normalize_address(address) for address in addresses if address}
+    ]
+    if not tasks:
+        return
+    GeocodingTask.objects.bulk_create(tasks, ignore_conflicts=True)
+
+    if settings.GEOCODER_BACKGROUND_WORKER:
+        _get_background_executor().submit(_process_geocoding_queue_in_background)
+
+
+def claim_geocoding_tasks(batch_size=GEOCODING_QUEUE_BATCH_SIZE):
+    """Снимает с очереди до batch_size самых старых адресов и возвращает их.
+
+    Строки, которые уже забрал другой процесс, пропускаются, поэтому
+    обработчики очереди в разных воркерах gunicorn не геокодируют один адрес
+    дважды. Если процесс упадёт, не успев геокодировать адрес, адрес снова
+    встанет в очередь при следующем чтении из кэша.
+    """
+    with transaction.atomic():
+        addresses = list(
+            GeocodingTask.objects
+            .select_for_update(skip_locked=True)
+            .order_by('created_at')
+            .values_list('address', flat=True)[:batch_size]
+        )
+        GeocodingTask.objects.filter(address__in=addresses).delete()
+    return addresses
+
+
+def process_geocoding_queue(batch_size=GEOCODING_QUEUE_BATCH_SIZE):
+    """Геокодирует все адреса из очереди пачками. Возвращает количество обработанных адресов.
+
+    Адреса, у которых уже есть координаты или ещё не подошло время повторной
+    попытки, снимаются с очереди без запроса к API.
+    """
+    if not settings.YANDEX_GEOCODER_API_KEY:
+        return 0
+
+    processed = 0
+    while True:
+        addresses = claim_geocoding_tasks(batch_size)
+        if not addresses:
+            return processed
+        resolved_addresses = set(
+            GeoPlace.objects
+            .filter(address__in=addresses)
+            .filter(Q(latitude__isnull=False) | Q(next_retry_at__gt=timezone.now()))
+            .values_list('address', flat=True)
+        )
+        geocode_and_save([address for address in addresses if address not in resolved_addresses])
+        processed += len(addresses)
+
+
+def _get_background_executor():
+    global _background_executor
+    with _lock:
+        if _background_executor is None:
+            _background_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='geocoding')
+    return _background_executor
+
+
+def _process_geocoding_queue_in_background():
+    try:
+        process_geocoding_queue()
+    finally:
+        connection.close()
 
 
 def get_coordinates_batch(addresses):
-    """Возвращает словарь {адрес: (lat, lng)}, берет координаты из БД или API Яндекса."""
+    """Возвращает словарь {адрес: (lat, lng)}, берет координаты из БД или API Яндекса.
+
+    Новые адреса геокодируются сразу. Адреса, по которым геокодер раньше не
+    ответил, перезапрашиваются в фоне, когда подойдёт время повторной попытки.
+    """
     if not addresses:
         return {}
     
     if not settings.YANDEX_GEOCODER_API_KEY:
         return {}
     
-    normalized_addresses = [' '.join(addr.split()) for addr in addresses if addr]
+    normalized_addresses = list(dict.fromkeys(normalize_address(addr) for addr in addresses if addr))
     
-    existing_places = GeoPlace.objects.filter(address__in=normalized_addresses)
-    coordinates = {}
-    
-    for place in existing_places:
-        if place.latitude is not None and place.longitude is not None:
-            coordinates[place.address] = (place.latitude, place.longitude)
-    
-    existing_addresses = {place.address for place in existing_places}
-    missing_addresses = [addr for addr in normalized_addresses if addr not in existing_addresses]
-    
-    for address in missing_addresses:
-        coords = _get_coordinates_from_api(address)
-        
-        GeoPlace.objects.update_or_create(
-            address=address,
-            defaults={
-                'latitude': coords[0] if coords else None,
-                'longitude': coords[1] if coords else None,
-            }
+    places = get_places(normalized_addresses)
+    coordinates = {
+        address: place.coordinates
+        for address, place in places.items()
+        if place.coordinates
+    }
+
+    now = timezone.now()
+    enqueue_geocoding([address for address, place in places.items() if place.is_retry_due(now)])
+
+    missing_addresses = [addr for addr in normalized_addresses if addr not in places]
+    if missing_addresses:
+        coordinates.update(
+            (address, coords)
+            for address, coords in geocode_and_save(missing_addresses).items()
+            if coords
         )
-        
-        if coords:
-            coordinates[address] = coords
-    
     return coordinates
 
 
+def geocode_and_save(addresses):
+    """Запрашивает координаты адресов у API и сохраняет результат в GeoPlace и кэш.
 
+    Неудачи записываются с причиной и временем следующей попытки.
+    Возвращает {адрес: (lat, lng) или None}.
+    """
+    if not addresses:
+        return {}
+
+    failed_attempts = dict(
+        GeoPlace.objects
+        .filter(address__in=addresses, latitude__isnull=True)
+        .values_list('address', 'failed_attempts')
+    )
+    results = geocode_addresses(addresses)
+    now = timezone.now()
+
+    places = []
+    for address, (coords, failure_reason) in results.items():
+        if coords:
+            places.append(GeoPlace(
+                address=address,
+                latitude=coords[0],
+                longitude=coords[1],
+            ))
+            continue
+        attempts = failed_attempts.get(address, 0) + 1
+        places.append(GeoPlace(
+            address=address,
+            failure_reason=failure_reason,
+            failed_attempts=attempts,
+            next_retry_at=now + get_retry_delay(attempts),
+        ))
+
+    GeoPlace.objects.bulk_create(
+        places,
+        update_conflicts=True,
+        unique_fields=['address'],
+        update_fields=['latitude', 'longitude', 'failure_reason', 'failed_attempts', 'next_retry_at'],
+    )
+    set_places({
+        place.address: CachedPlace(place.latitude, place.longitude, place.next_retry_at)
+        for place in places
+    })
+    # Прежняя неудача могла остаться в локальных кэшах других процессов
+    if any(place.latitude is not None and place.address in failed_attempts for place in places):
+        bump_generation()
+    places_changed.send(
+        sender=GeoPlace,
+        addresses=[place.address for place in places if place.latitude is not None],
+    )
+    return {address: coords for address, (coords, _) in results.items()}
+
+
+def geocode_addresses(addresses):
+    """Параллельно запрашивает координаты адресов у API Яндекса.
+
+    Возвращает {адрес: ((lat, lng) или None, причина неудачи или None)}.
+    """
+    workers = min(settings.YANDEX_GEOCODER_MAX_WORKERS, len(addresses))
+    if workers <= 1:
+        return {address: _get_coordinates_from_api(address) for address in addresses}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(addresses, executor.map(_get_coordinates_from_api, addresses)))
 
 
 def _get_coordinates_from_api(address):
-    """Получает координаты по адресу из API Яндекса"""
+    """Получает координаты по адресу из API Яндекса. Возвращает пару (координаты, причина неудачи)."""
+    get_rate_limiter().acquire()
+    started_at = time.perf_counter()
+    coordinates, failure_reason = _request_coordinates(address)
+    GEOCODER_API_DURATION.labels(failure_reason or 'found').observe(time.perf_counter() - started_at)
+    return coordinates, failure_reason
+
+
+def _request_coordinates(address):
     try:
         params = {
             'apikey': settings.YANDEX_GEOCODER_API_KEY,
@@ -53,19 +298,23 @@ def _get_coordinates_from_api(address):
             'lang': 'ru_RU'
         }
         
-        response = requests.get(settings.YANDEX_GEOCODER_BASE_URL, params=params, timeout=5)
+        response = get_session().get(
+            settings.YANDEX_GEOCODER_BASE_URL,
+            params=params,
+            timeout=settings.YANDEX_GEOCODER_TIMEOUT,
+        )
         response.raise_for_status()
         
         data = response.json()
         feature_member = data['response']['GeoObjectCollection']['featureMember']
         
         if not feature_member:
-            return None
+            return None, GeoPlace.NOT_FOUND
             
         coords_str = feature_member[0]['GeoObject']['Point']['pos']
         longitude, latitude = map(float, coords_str.split())
         
-        return latitude, longitude
+        return (latitude, longitude), None
         
     except (requests.RequestException, KeyError, ValueError):
-        return None 
\ No newline at end of file
+        return None, GeoPlace.REQUEST_FAILED
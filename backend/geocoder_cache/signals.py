@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+
+# Координаты адресов появились или изменились. Аргумент addresses — нормализованные адреса
+places_changed = Signal()
@@ -0,0 +1,118 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubGeocoderServer:
+    """Локальный HTTP-сервер, отвечающий в формате API Яндекс.Геокодера.
+
+    Координаты берутся из словаря {адрес: (lat, lng)}, на остальные адреса
+    сервер отвечает пустым списком, а на адреса из failing_addresses —
+    ошибкой 503. В max_concurrent_requests запоминается, сколько запросов
+    обрабатывалось одновременно. Используется в тестах и бенчмарках вместе
+    с настройкой YANDEX_GEOCODER_BASE_URL:
+
+        with StubGeocoderServer({'Москва': (55.75, 37.62)}) as server:
+            with override_settings(YANDEX_GEOCODER_BASE_URL=server.base_url):
+                ...
+    """
+
+    def __init__(self, places=None, delay=0, failing_addresses=()):
+        self.places = places or {}
+        self.delay = delay
+        self.failing_addresses = set(failing_addresses)
+        self.requested_addresses = []
+        self.max_concurrent_requests = 0
+        self._active_requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/1.x/'
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def render_response(self, address):
+        coords = self.places.get(address)
+        feature_member = []
+        if coords:
+            latitude, longitude = coords
+            feature_member.append({
+                'GeoObject': {
+                    'name': address,
+                    'Point': {'pos': f'{longitude} {latitude}'},
+                },
+            })
+        return {
+            'response': {
+                'GeoObjectCollection': {
+                    'metaDataProperty': {
+                        'GeocoderResponseMetaData': {
+                            'request': address,
+                            'found': str(len(feature_member)),
+                        },
+                    },
+                    'featureMember': feature_member,
+                },
+            },
+        }
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                address = parse_qs(urlparse(self.path).query).get('geocode', [''])[0]
+                with stub._lock:
+                    stub.requested_addresses.append(address)
+                    stub._active_requests += 1
+                    stub.max_concurrent_requests = max(stub.max_concurrent_requests, stub._active_requests)
+                try:
+                    self.respond(address)
+                finally:
+                    with stub._lock:
+                        stub._active_requests -= 1
+
+            def respond(self, address):
+                if stub.delay:
+                    threading.Event().wait(stub.delay)
+
+                if address in stub.failing_addresses:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                body = json.dumps(stub.render_response(address)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
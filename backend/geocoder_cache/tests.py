@@ -1,3 +1,210 @@
-from django.test import TestCase
-# Create your tests here.
+from datetime import timedelta
 
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from foodcartapp.models import Restaurant
+
+from .cache import local_cache
+from .models import GeoPlace, GeocodingTask
+from .services import (
+    claim_geocoding_tasks,
+    enqueue_geocoding,
+    get_cached_coordinates,
+    get_coordinates_batch,
+    process_geocoding_queue,
+)
+from .testing import StubGeocoderServer
+
+
+PLACES = {
+    'Москва, Красная площадь, 1': (55.753544, 37.621202),
+    'Москва, Тверская улица, 7': (55.757962, 37.611868),
+    'Москва, Арбат, 10': (55.751426, 37.596183),
+}
+
+
+class GetCoordinatesBatchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.server = StubGeocoderServer(PLACES).start()
+        self.addCleanup(self.server.stop)
+        settings_override = override_settings(
+            YANDEX_GEOCODER_API_KEY='test',
+            YANDEX_GEOCODER_BASE_URL=self.server.base_url,
+            YANDEX_GEOCODER_MAX_WORKERS=4,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_missing_addresses_are_geocoded_and_saved(self):
+        addresses = list(PLACES) + ['Нигде, несуществующий адрес']
+
+        coordinates = get_coordinates_batch(addresses)
+
+        self.assertEqual(coordinates, PLACES)
+        self.assertEqual(GeoPlace.objects.count(), 4)
+        not_found = GeoPlace.objects.get(address='Нигде, несуществующий адрес')
+        self.assertIsNone(not_found.latitude)
+        self.assertEqual(not_found.failure_reason, GeoPlace.NOT_FOUND)
+        self.assertIsNotNone(not_found.next_retry_at)
+
+    def test_saved_addresses_are_not_requested_again(self):
+        get_coordinates_batch(list(PLACES))
+        self.server.requested_addresses.clear()
+
+        coordinates = get_coordinates_batch(['  Москва,  Арбат, 10 '])
+
+        self.assertEqual(coordinates, {'Москва, Арбат, 10': PLACES['Москва, Арбат, 10']})
+        self.assertEqual(self.server.requested_addresses, [])
+
+    def test_requests_run_concurrently(self):
+        self.server.delay = 0.2
+
+        get_coordinates_batch(list(PLACES))
+
+        self.assertEqual(self.server.max_concurrent_requests, len(PLACES))
+
+    def test_known_addresses_are_served_from_cache(self):
+        get_coordinates_batch(list(PLACES))
+
+        with self.assertNumQueries(0):
+            coordinates = get_coordinates_batch(list(PLACES))
+
+        self.assertEqual(coordinates, PLACES)
+
+
+@override_settings(
+    YANDEX_GEOCODER_API_KEY='test',
+    GEOCODER_BACKGROUND_WORKER=False,
+    GEOCODER_RETRY_BASE_DELAY=60,
+)
+class FailedGeocodingRetryTest(TestCase):
+    address = 'Москва, Красная площадь, 1'
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+
+    def geocode(self, server):
+        with override_settings(YANDEX_GEOCODER_BASE_URL=server.base_url):
+            return get_coordinates_batch([self.address])
+
+    def expire_retry(self):
+        GeoPlace.objects.update(next_retry_at=timezone.now() - timedelta(seconds=1))
+        cache.clear()
+
+    def test_failure_is_not_retried_before_backoff_expires(self):
+        with StubGeocoderServer(PLACES, failing_addresses=[self.address]) as server:
+            self.assertEqual(self.geocode(server), {})
+            self.assertEqual(self.geocode(server), {})
+
+        self.assertEqual(server.requested_addresses, [self.address])
+        place = GeoPlace.objects.get(address=self.address)
+        self.assertEqual(place.failure_reason, GeoPlace.REQUEST_FAILED)
+        self.assertEqual(place.failed_attempts, 1)
+        self.assertFalse(GeocodingTask.objects.exists())
+
+    def test_backoff_grows_with_each_failure(self):
+        with StubGeocoderServer(PLACES, failing_addresses=[self.address]) as server:
+            self.geocode(server)
+            first_delay = GeoPlace.objects.get().next_retry_at - timezone.now()
+
+            self.expire_retry()
+            self.geocode(server)
+            with override_settings(YANDEX_GEOCODER_BASE_URL=server.base_url):
+                process_geocoding_queue()
+
+        place = GeoPlace.objects.get()
+        self.assertEqual(place.failed_attempts, 2)
+        self.assertGreater(place.next_retry_at - timezone.now(), first_delay * 1.5)
+
+    def test_expired_failure_is_retried_in_background(self):
+        with StubGeocoderServer(PLACES, failing_addresses=[self.address]) as server:
+            self.geocode(server)
+        self.expire_retry()
+
+        coordinates, pending_addresses = get_cached_coordinates([self.address])
+        self.assertEqual(coordinates, {})
+        self.assertEqual(pending_addresses, [self.address])
+
+        with StubGeocoderServer(PLACES) as server:
+            self.assertEqual(self.geocode(server), {})
+            self.assertEqual(server.requested_addresses, [])
+            self.assertTrue(GeocodingTask.objects.filter(address=self.address).exists())
+
+            with override_settings(YANDEX_GEOCODER_BASE_URL=server.base_url):
+                process_geocoding_queue()
+
+        place = GeoPlace.objects.get(address=self.address)
+        self.assertEqual((place.latitude, place.longitude), PLACES[self.address])
+        self.assertEqual(place.failure_reason, '')
+        self.assertEqual(place.failed_attempts, 0)
+        self.assertIsNone(place.next_retry_at)
+
+    @override_settings(GEOCODER_BACKGROUND_WORKER=False)
+    def test_queued_address_is_claimed_by_one_consumer(self):
+        enqueue_geocoding(PLACES)
+
+        first_batch = claim_geocoding_tasks(batch_size=2)
+        second_batch = claim_geocoding_tasks(batch_size=2)
+
+        self.assertEqual(len(first_batch), 2)
+        self.assertEqual(sorted(first_batch + second_batch), sorted(PLACES))
+        self.assertEqual(claim_geocoding_tasks(batch_size=2), [])
+        self.assertFalse(GeocodingTask.objects.exists())
+
+    def test_recovered_address_resets_local_caches_of_other_processes(self):
+        with StubGeocoderServer(PLACES, failing_addresses=[self.address]) as server:
+            self.geocode(server)
+        self.expire_retry()
+
+        with StubGeocoderServer(PLACES) as server:
+            self.geocode(server)
+            stale_places = local_cache.get_many([self.address])
+            with override_settings(YANDEX_GEOCODER_BASE_URL=server.base_url):
+                process_geocoding_queue()
+        # Так выглядит локальный кэш процесса, который не делал повторный запрос
+        local_cache.set_many(stale_places)
+
+        coordinates, _ = get_cached_coordinates([self.address])
+        self.assertEqual(coordinates, {self.address: PLACES[self.address]})
+
+
+@override_settings(YANDEX_GEOCODER_API_KEY='test', GEOCODER_BACKGROUND_WORKER=False)
+class RestaurantCoordinatesTest(TestCase):
+    address = 'Москва, Тверская улица, 7'
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+
+    def test_restaurant_gets_coordinates_once_address_is_geocoded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant = Restaurant.objects.create(name='Star Burger', address=self.address)
+
+        restaurant.refresh_from_db()
+        self.assertIsNone(restaurant.latitude)
+        self.assertTrue(GeocodingTask.objects.filter(address=self.address).exists())
+
+        with StubGeocoderServer(PLACES) as server:
+            with override_settings(YANDEX_GEOCODER_BASE_URL=server.base_url):
+                process_geocoding_queue()
+
+        restaurant.refresh_from_db()
+        self.assertEqual((restaurant.latitude, restaurant.longitude), PLACES[self.address])
+        self.assertFalse(Restaurant.objects.with_outdated_coordinates().exists())
+
+    def test_changed_address_is_located_from_cache(self):
+        GeoPlace.objects.create(address=self.address, latitude=55.757962, longitude=37.611868)
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Арбат, 10')
+
+        restaurant.address = self.address
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant.save()
+
+        restaurant.refresh_from_db()
+        self.assertEqual((restaurant.latitude, restaurant.longitude), PLACES[self.address])
+        self.assertEqual(restaurant.coordinates_address, self.address)
@@ -0,0 +1,134 @@
+import math
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from foodcartapp.models import Order, OrderEvent
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает нагрузку на БД от страницы заказов: менеджеры обновляют её '
+        'каждые --interval секунд или подписаны на поток событий. Поток читается '
+        'через настоящее представление order_events, только без пауз между '
+        'опросами журнала: каждый опрос — один шаг ORDER_EVENTS_POLL_INTERVAL. '
+        'Лимит ORDER_EVENTS_MAX_STREAMS на время замера снимается, а сколько '
+        'потоков gunicorn займут соединения, считается отдельно по --workers и --threads. '
+        'Все изменения в БД откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--managers', type=int, default=20)
+        parser.add_argument('--interval', type=float, default=10, help='Период обновления страницы, секунд')
+        parser.add_argument('--duration', type=float, default=60, help='Моделируемый промежуток времени, секунд')
+        parser.add_argument('--status-changes', type=int, default=10, help='Сколько заказов меняет статус за это время')
+        parser.add_argument('--workers', type=int, default=3, help='Воркеров gunicorn')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков в воркере gunicorn')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(**options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, managers, interval, duration, status_changes, workers, threads, **options):
+        user = get_user_model().objects.create(username='benchmark-manager', is_staff=True)
+        client = Client()
+        client.force_login(user)
+
+        polling = self.measure(
+            managers * int(duration / interval),
+            lambda: client.get(reverse('restaurateur:view_orders')),
+        )
+
+        orders = list(Order.objects.exclude(status='completed').order_by('-created_at')[:status_changes])
+        last_event_id = OrderEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        polls_per_manager = int(duration / settings.ORDER_EVENTS_POLL_INTERVAL)
+        polls_per_stream = max(1, int(settings.ORDER_EVENTS_STREAM_DURATION / settings.ORDER_EVENTS_POLL_INTERVAL))
+        stream = None
+        cursors = [last_event_id] * managers
+        responses = [None] * managers
+
+        def connect(manager):
+            responses[manager] = client.get(
+                reverse('restaurateur:order_events'),
+                HTTP_LAST_EVENT_ID=str(cursors[manager]),
+            )
+
+        def read_poll(manager):
+            # Поток отдаёт новые события и ': ping' после каждого опроса журнала
+            for chunk in responses[manager].streaming_content:
+                chunk = chunk.decode()
+                if chunk.startswith('id: '):
+                    cursors[manager] = int(chunk.split('\n', 1)[0][len('id: '):])
+                if chunk.startswith(': ping'):
+                    return
+
+        max_streams = settings.ORDER_EVENTS_MAX_STREAMS
+        with override_settings(
+            ORDER_EVENTS_POLL_INTERVAL=0,
+            ORDER_EVENTS_STREAM_DURATION=math.inf,
+            ORDER_EVENTS_MAX_STREAMS=managers,
+        ):
+            for poll in range(polls_per_manager):
+                if orders and poll % max(1, polls_per_manager // len(orders)) == 0:
+                    order = orders.pop()
+                    order.status = 'confirmed' if order.status == 'new' else 'preparing'
+                    order.save(update_fields=['status', 'updated_at'])
+                for manager in range(managers):
+                    if poll % polls_per_stream == 0:
+                        if responses[manager] is not None:
+                            responses[manager].close()
+                        stream = self.measure(1, lambda: connect(manager), stream)
+                    stream = self.measure(1, lambda: read_poll(manager), stream)
+            for response in responses:
+                if response is not None:
+                    response.close()
+
+        self.stdout.write(
+            f'{managers} менеджеров, {duration:g} с, '
+            f'{Order.objects.exclude(status="completed").count()} активных заказов'
+        )
+        self.report(f'Обновление страницы каждые {interval:g} с', polling)
+        self.report('Подписка на поток событий', stream)
+
+        streams = min(managers, workers * max_streams)
+        self.stdout.write(
+            f'  потоков gunicorn занято соединениями: {streams} из {workers * threads}, '
+            f'опросом раз в {settings.ORDER_EVENTS_FALLBACK_INTERVAL:g} с получают события '
+            f'{managers - streams} менеджеров'
+        )
+
+    def measure(self, repeat, func, totals=None):
+        if totals is None:
+            totals = {'requests': 0, 'queries': 0, 'db_time': 0.0, 'wall_time': 0.0}
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            totals['wall_time'] += time.perf_counter() - started_at
+            totals['requests'] += 1
+            totals['queries'] += len(queries)
+            totals['db_time'] += sum(float(query['time']) for query in queries.captured_queries)
+        return totals
+
+    def report(self, title, totals):
+        self.stdout.write(self.style.SUCCESS(title))
+        self.stdout.write(
+            f'  обращений: {totals["requests"]}, SQL-запросов: {totals["queries"]}, '
+            f'время в БД: {totals["db_time"]:.3f} с, '
+            f'время обработки: {totals["wall_time"]:.3f} с'
+        )
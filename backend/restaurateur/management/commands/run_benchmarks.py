@@ -0,0 +1,185 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from foodcartapp.models import Product
+from geocoder_cache.models import GeoPlace
+from geocoder_cache.testing import StubGeocoderServer
+from star_burger.benchmarking import percentile
+
+
+DATA_SIZES = {
+    'small': {'restaurants': 10, 'products': 50, 'orders': 1_000, 'addresses': 500},
+    'medium': {'restaurants': 30, 'products': 150, 'orders': 20_000, 'addresses': 5_000},
+    'large': {'restaurants': 60, 'products': 300, 'orders': 200_000, 'addresses': 20_000},
+}
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержки, пропускную способность и число SQL-запросов '
+        'горячих страниц и API на синтетических данных разного объёма. '
+        'Работает на отдельной тестовой БД и без доступа в сеть: геокодер '
+        'подменяется локальным сервером.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='small,medium',
+            help=f'Объёмы данных через запятую: {", ".join(DATA_SIZES)}',
+        )
+        parser.add_argument('--repeat', type=int, default=30, help='Сколько раз вызывать каждый сценарий')
+        parser.add_argument('--warmup', type=int, default=3, help='Сколько первых вызовов не учитывать')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Куда сохранить результаты в JSON, по умолчанию — в stdout')
+
+    def handle(self, *args, **options):
+        sizes = [size for size in options['sizes'].split(',') if size]
+        unknown_sizes = set(sizes) - DATA_SIZES.keys()
+        if unknown_sizes:
+            raise CommandError(f'Неизвестные объёмы данных: {", ".join(sorted(unknown_sizes))}')
+
+        self.repeat = options['repeat']
+        self.warmup = options['warmup']
+        self.random = random.Random(options['seed'])
+
+        report = {
+            'commit': get_git_commit(),
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'repeat': self.repeat,
+            'sizes': {},
+        }
+
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with StubGeocoderServer() as geocoder, override_settings(
+                YANDEX_GEOCODER_API_KEY='benchmark',
+                YANDEX_GEOCODER_BASE_URL=geocoder.base_url,
+                GEOCODER_BACKGROUND_WORKER=False,
+            ):
+                for size in sizes:
+                    report['sizes'][size] = self.run_size(size, options['seed'], geocoder)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        content = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(content)
+            self.stderr.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
+        else:
+            self.stdout.write(content)
+
+    def run_size(self, size, seed, geocoder):
+        self.stderr.write(f'Готовим данные: {size}')
+        call_command('flush', interactive=False, verbosity=0)
+        cache.clear()
+        call_command('generate_load_data', seed=seed, stdout=self.stderr, **DATA_SIZES[size])
+        geocoder.places = {
+            address: (latitude, longitude)
+            for address, latitude, longitude in GeoPlace.objects.values_list('address', 'latitude', 'longitude')
+        }
+        return {
+            'data': DATA_SIZES[size],
+            'scenarios': self.run_scenarios(),
+        }
+
+    def run_scenarios(self):
+        manager = get_user_model().objects.create(username='benchmark-manager', is_staff=True)
+        manager_client = Client()
+        manager_client.force_login(manager)
+        client = Client()
+
+        product_ids = list(Product.objects.available().values_list('id', flat=True))
+
+        def register_order():
+            return client.post(
+                reverse('foodcartapp:register_order'),
+                {
+                    'firstname': 'Бенчмарк',
+                    'lastname': 'Бенчмарков',
+                    'phonenumber': '+79160000000',
+                    'address': 'Москва, ул. Тверская, д. 1',
+                    'products': [
+                        {'product': product_id, 'quantity': 1}
+                        for product_id in self.random.sample(product_ids, min(3, len(product_ids)))
+                    ],
+                },
+                content_type='application/json',
+            )
+
+        scenarios = {
+            'product_list_api': lambda: client.get(reverse('foodcartapp:product_list_api')),
+            'register_order': register_order,
+            'view_orders': lambda: manager_client.get(reverse('restaurateur:view_orders')),
+            'view_products': lambda: manager_client.get(reverse('restaurateur:ProductsView')),
+        }
+        return {name: self.measure(name, request) for name, request in scenarios.items()}
+
+    def measure(self, name, request):
+        latencies = []
+        queries = []
+        for attempt in range(self.warmup + self.repeat):
+            started_at = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                response = request()
+            latency = time.perf_counter() - started_at
+            if response.status_code >= 400:
+                raise CommandError(f'{name}: ответ {response.status_code}')
+            if attempt >= self.warmup:
+                latencies.append(latency)
+                queries.append(len(captured))
+
+        total_time = sum(latencies)
+        result = {
+            'latency_ms': {
+                'mean': statistics.mean(latencies) * 1000,
+                'p50': percentile(latencies, 50) * 1000,
+                'p90': percentile(latencies, 90) * 1000,
+                'p99': percentile(latencies, 99) * 1000,
+                'max': max(latencies) * 1000,
+            },
+            'throughput_rps': len(latencies) / total_time if total_time else None,
+            'queries': {
+                'mean': statistics.mean(queries),
+                'max': max(queries),
+            },
+        }
+        self.stderr.write(
+            f'  {name}: p50 {result["latency_ms"]["p50"]:.1f} мс, '
+            f'p99 {result["latency_ms"]["p99"]:.1f} мс, '
+            f'запросов {result["queries"]["max"]}'
+        )
+        return result
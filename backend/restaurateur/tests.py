@@ -1,3 +1,526 @@
-from django.test import TestCase
-# Create your tests here.
+import tempfile
+from datetime import timedelta
+from io import StringIO
 
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from foodcartapp.assignment import AssignmentSolver
+from foodcartapp.caching import CATALOG_NAMESPACE, get_version
+from foodcartapp.eta import DeliveryTimePredictor, fit_delivery_time_stats
+from foodcartapp.models import DeliveryTimeStats, Order, OrderEvent, OrderItem, Product, Restaurant, RestaurantMenuItem
+from foodcartapp.restaurant_load import get_restaurant_loads
+from foodcartapp.services import get_restaurant_distances
+from geocoder_cache.cache import local_cache
+from geocoder_cache.models import GeoPlace
+from restaurateur.views import poll_order_events, serve_order_events, stream_order_events
+from star_burger.query_budget import (
+    QueryBudgetExceeded,
+    QueryBudgetMiddleware,
+    assert_max_queries,
+    query_budget,
+)
+
+
+@override_settings(QUERY_BUDGET_MODE='raise', GEOCODER_BACKGROUND_WORKER=False)
+class ManagerViewsQueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generate_load_data',
+            restaurants=5,
+            categories=3,
+            products=30,
+            orders=60,
+            addresses=20,
+            seed=1,
+            stdout=StringIO(),
+        )
+        cls.manager = User.objects.create_user('manager', password='password', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.client.force_login(self.manager)
+
+    def test_manager_pages_stay_within_budget(self):
+        for url_name in ['view_orders', 'ProductsView', 'RestaurantView', 'orders_api']:
+            with self.subTest(url_name=url_name):
+                response = self.client.get(reverse(f'restaurateur:{url_name}'))
+                self.assertEqual(response.status_code, 200)
+
+    def test_product_list_stays_within_budget(self):
+        response = self.client.get(reverse('foodcartapp:product_list_api'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_orders_query_count_does_not_grow_with_orders(self):
+        with assert_max_queries(15, 'view_orders'):
+            self.client.get(reverse('restaurateur:view_orders'))
+
+        call_command(
+            'generate_load_data',
+            restaurants=2,
+            categories=1,
+            products=10,
+            orders=120,
+            addresses=10,
+            seed=2,
+            stdout=StringIO(),
+        )
+
+        with assert_max_queries(15, 'view_orders'):
+            self.client.get(reverse('restaurateur:view_orders'))
+
+
+class CachedManagerPagesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.create(name='Star Burger Арбат', address='Москва, Арбат, 10')
+        cls.manager = User.objects.create_user('manager', password='password', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def test_restaurants_page_is_cached_until_restaurant_changes(self):
+        url = reverse('restaurateur:RestaurantView')
+        self.client.get(url)
+
+        with assert_max_queries(2, 'закэшированная страница'):
+            response = self.client.get(url)
+        self.assertContains(response, 'Star Burger Арбат')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.name = 'Star Burger Тверская'
+            self.restaurant.save()
+
+        response = self.client.get(url)
+        self.assertContains(response, 'Star Burger Тверская')
+        self.assertNotContains(response, 'Star Burger Арбат')
+
+
+class StopListApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.create(name='Star Burger Арбат', address='Москва, Арбат, 10')
+        cls.products = [
+            Product.objects.create(name=f'Бургер {number}', price=100, image='burger.jpg')
+            for number in range(3)
+        ]
+        for product in cls.products:
+            RestaurantMenuItem.objects.create(restaurant=cls.restaurant, product=product)
+        cls.manager = User.objects.create_user('manager', password='password', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def post_stop_list(self, items):
+        return self.client.post(
+            reverse('restaurateur:stop_list_api'),
+            {'items': items},
+            content_type='application/json',
+        )
+
+    def test_availability_is_changed_in_one_batch(self):
+        catalog_version = get_version(CATALOG_NAMESPACE)
+
+        response = self.post_stop_list([
+            {'restaurant': self.restaurant.id, 'product': product.id, 'availability': False}
+            for product in self.products[:2]
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['updated'], 2)
+        self.assertNotEqual(response.json()['catalog_version'], catalog_version)
+        self.assertEqual(response.json()['catalog_version'], get_version(CATALOG_NAMESPACE))
+        self.assertQuerySetEqual(Product.objects.available(), [self.products[2]])
+
+    def test_unchanged_items_keep_catalog_version(self):
+        catalog_version = get_version(CATALOG_NAMESPACE)
+
+        response = self.post_stop_list([
+            {'restaurant': self.restaurant.id, 'product': self.products[0].id, 'availability': True},
+        ])
+
+        self.assertEqual(response.json(), {'updated': 0, 'catalog_version': catalog_version})
+
+    def test_items_missing_from_menu_are_rejected(self):
+        other_restaurant = Restaurant.objects.create(name='Star Burger Тверская')
+
+        response = self.post_stop_list([
+            {'restaurant': self.restaurant.id, 'product': self.products[0].id, 'availability': False},
+            {'restaurant': other_restaurant.id, 'product': self.products[0].id, 'availability': False},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()['missing'],
+            [{'restaurant': other_restaurant.id, 'product': self.products[0].id}],
+        )
+        self.assertTrue(RestaurantMenuItem.objects.get(product=self.products[0]).availability)
+
+
+class AssignmentSolverTest(TestCase):
+    def test_full_restaurant_is_freed_for_order_without_alternatives(self):
+        distances = {
+            'near_both': {'arbat': 1, 'tverskaya': 2},
+            'near_arbat': {'arbat': 1.5},
+        }
+
+        solution = AssignmentSolver(distances, {'arbat': 1, 'tverskaya': 1}).solve()
+
+        self.assertEqual(solution, {'near_both': 'tverskaya', 'near_arbat': 'arbat'})
+
+
+@override_settings(QUERY_BUDGET_MODE='raise', GEOCODER_BACKGROUND_WORKER=False)
+class AssignmentsApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        cls.arbat = Restaurant.objects.create(
+            name='Star Burger Арбат', latitude=55.751426, longitude=37.596183, max_active_orders=1,
+        )
+        cls.tverskaya = Restaurant.objects.create(
+            name='Star Burger Тверская', latitude=55.757962, longitude=37.611868,
+        )
+        for restaurant in [cls.arbat, cls.tverskaya]:
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=cls.product)
+        GeoPlace.objects.create(address='Москва, Арбат, 12', latitude=55.751, longitude=37.595)
+        GeoPlace.objects.create(address='Москва, Арбат, 20', latitude=55.7505, longitude=37.593)
+        cls.orders = []
+        for address in ['Москва, Арбат, 12', 'Москва, Арбат, 20']:
+            order = Order.objects.create(firstname='Иван', lastname='Иванов', phonenumber='+79291000000', address=address)
+            OrderItem.objects.create(order=order, product=cls.product, quantity=1, price=100)
+            cls.orders.append(order)
+        cls.manager = User.objects.create_user('manager', password='password', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.client.force_login(self.manager)
+
+    def test_suggestion_respects_restaurant_capacity(self):
+        response = self.client.get(reverse('restaurateur:assignments_api'))
+
+        self.assertEqual(response.status_code, 200)
+        restaurants = sorted(assignment['restaurant']['id'] for assignment in response.json()['assignments'])
+        self.assertEqual(restaurants, [self.arbat.id, self.tverskaya.id])
+        self.assertFalse(Order.objects.filter(restaurant__isnull=False).exists())
+
+    def test_assignments_are_saved_with_order_events(self):
+        response = self.client.post(reverse('restaurateur:assignments_api'))
+
+        self.assertEqual(len(response.json()['assignments']), 2)
+        self.assertEqual(response.json()['unassigned'], [])
+        self.assertEqual(Order.objects.filter(restaurant=self.arbat).count(), 1)
+        self.assertEqual(OrderEvent.objects.filter(kind=OrderEvent.UPDATED).count(), 2)
+
+        response = self.client.post(reverse('restaurateur:assignments_api'))
+
+        self.assertEqual(response.json()['assignments'], [])
+
+
+@override_settings(KITCHEN_MINUTES_PER_QUEUED_ORDER=4, COURIER_SPEED_KMH=20)
+class RestaurantLoadTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.arbat = Restaurant.objects.create(name='Star Burger Арбат', latitude=55.751426, longitude=37.596183)
+        cls.tverskaya = Restaurant.objects.create(name='Star Burger Тверская', latitude=55.757962, longitude=37.611868)
+
+    def setUp(self):
+        cache.clear()
+
+    def create_order(self, restaurant, status='preparing'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Order.objects.create(
+                firstname='Иван', lastname='Иванов', phonenumber='+79291000000',
+                address='Москва, Арбат, 12', restaurant=restaurant, status=status,
+            )
+
+    def test_cached_load_follows_order_changes(self):
+        order = self.create_order(self.arbat)
+        self.create_order(self.arbat, status='delivering')
+        self.assertEqual(get_restaurant_loads([self.arbat.id, self.tverskaya.id]), {self.arbat.id: 1, self.tverskaya.id: 0})
+
+        order = Order.objects.get(pk=order.pk)
+        order.restaurant = self.tverskaya
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        self.create_order(self.arbat, status='new')
+
+        with self.assertNumQueries(0):
+            loads = get_restaurant_loads([self.arbat.id, self.tverskaya.id])
+        self.assertEqual(loads, {self.arbat.id: 1, self.tverskaya.id: 1})
+
+        order.status = 'completed'
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        self.assertEqual(get_restaurant_loads([self.tverskaya.id]), {self.tverskaya.id: 0})
+
+    def test_load_is_counted_by_db_with_file_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir},
+        }):
+            self.create_order(self.arbat)
+            self.assertEqual(get_restaurant_loads([self.arbat.id]), {self.arbat.id: 1})
+
+            self.create_order(self.arbat, status='new')
+            with self.assertNumQueries(1):
+                self.assertEqual(get_restaurant_loads([self.arbat.id]), {self.arbat.id: 2})
+            self.assertEqual(cache.get_many([f'foodcartapp:restaurant_load:{self.arbat.id}']), {})
+
+    def test_busy_kitchen_loses_to_idle_restaurant_nearby(self):
+        delivery_coords = (55.751, 37.595)
+
+        ranked = get_restaurant_distances(delivery_coords, [self.arbat, self.tverskaya])
+        self.assertEqual(ranked[0][0], self.arbat)
+
+        ranked = get_restaurant_distances(
+            delivery_coords,
+            [self.arbat, self.tverskaya],
+            loads={self.arbat.id: 5, self.tverskaya.id: 0},
+        )
+        self.assertEqual(ranked[0][0], self.tverskaya)
+
+
+@override_settings(ETA_MIN_SAMPLES=2, ETA_DISTANCE_BUCKET_KM=2, GEOCODER_BACKGROUND_WORKER=False)
+class DeliveryEtaTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.arbat = Restaurant.objects.create(name='Star Burger Арбат', latitude=55.751426, longitude=37.596183)
+        GeoPlace.objects.create(address='Москва, Арбат, 12', latitude=55.751, longitude=37.595)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+
+    def deliver(self, minutes, address='Москва, Арбат, 12'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Order.objects.create(
+                firstname='Иван', lastname='Иванов', phonenumber='+79291000000', address=address,
+                restaurant=self.arbat, status='completed',
+                delivered_at=timezone.now() + timedelta(minutes=minutes),
+            )
+
+    def test_completed_orders_update_statistics_incrementally(self):
+        for minutes in [30, 40, 50]:
+            self.deliver(minutes)
+
+        stats = DeliveryTimeStats.objects.get(restaurant_id=self.arbat.id, distance_bucket=0)
+        self.assertEqual(stats.count, 3)
+        self.assertAlmostEqual(stats.mean_minutes, 40, places=2)
+        self.assertAlmostEqual(stats.std_minutes, 10, places=2)
+        self.assertEqual(DeliveryTimePredictor().predict(self.arbat.id, 0.5), 40)
+
+        self.assertEqual(fit_delivery_time_stats(chunk_size=2), 3)
+        refitted = DeliveryTimeStats.objects.get(restaurant_id=self.arbat.id, distance_bucket=0)
+        self.assertEqual(refitted.count, 3)
+        self.assertAlmostEqual(refitted.mean_minutes, stats.mean_minutes)
+        self.assertAlmostEqual(refitted.m2, stats.m2)
+
+    def test_prediction_falls_back_to_wider_statistics(self):
+        for minutes in [20, 40]:
+            self.deliver(minutes)
+        self.deliver(90, address='Подмосковье, неизвестный адрес')
+
+        predictor = DeliveryTimePredictor()
+        self.assertEqual(predictor.predict(self.arbat.id, 5), 50)
+        self.assertEqual(predictor.predict(self.arbat.id + 1, 1), 30)
+        self.assertIsNone(DeliveryTimePredictor(min_samples=10).predict(self.arbat.id, 1))
+
+
+class OrdersApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='password', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def test_order_committed_after_request_is_returned_next_time(self):
+        server_time = self.client.get(reverse('restaurateur:orders_api')).json()['server_time']
+
+        # Транзакция сохранила заказ до запроса, а зафиксировалась после него
+        order = Order.objects.create(firstname='Иван', lastname='Иванов', phonenumber='+79291000000', address='Москва')
+        Order.objects.filter(pk=order.pk).update(updated_at=timezone.now() - timedelta(seconds=5))
+
+        response = self.client.get(reverse('restaurateur:orders_api'), {'updated_since': server_time})
+        self.assertEqual([result['id'] for result in response.json()['results']], [order.pk])
+
+    def create_orders(self, count, created_at):
+        orders = [
+            Order.objects.create(firstname='Иван', lastname='Иванов', phonenumber='+79291000000', address='Москва')
+            for _ in range(count)
+        ]
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(created_at=created_at)
+        return orders
+
+    def test_pages_cover_all_orders_once(self):
+        now = timezone.now()
+        # Заказы с одинаковым created_at упорядочиваются по id и не теряются на границе страниц
+        orders = self.create_orders(5, now) + self.create_orders(2, now - timedelta(minutes=1))
+
+        seen_ids = []
+        params = {'limit': 3}
+        while True:
+            response = self.client.get(reverse('restaurateur:orders_api'), params)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            seen_ids.extend(result['id'] for result in page['results'])
+            if page['next_cursor'] is None:
+                break
+            params['cursor'] = page['next_cursor']
+
+        expected_ids = sorted((order.pk for order in orders[:5]), reverse=True)
+        expected_ids += sorted((order.pk for order in orders[5:]), reverse=True)
+        self.assertEqual(seen_ids, expected_ids)
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in [
+            {'cursor': 'not-a-cursor'},
+            {'cursor': 'MjAyNC0xMy00NQ'},
+            {'updated_since': 'вчера'},
+            {'updated_since': '2024-13-45T00:00:00'},
+        ]:
+            with self.subTest(**params):
+                response = self.client.get(reverse('restaurateur:orders_api'), params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_naive_updated_since_is_read_in_server_timezone(self):
+        order = self.create_orders(1, timezone.now())[0]
+        updated_since = (order.updated_at - timedelta(seconds=1)).replace(tzinfo=None).isoformat()
+
+        response = self.client.get(reverse('restaurateur:orders_api'), {'updated_since': updated_since})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.json()['results']], [order.pk])
+
+
+@override_settings(ORDER_EVENTS_POLL_INTERVAL=0, ORDER_EVENTS_STREAM_DURATION=60)
+class OrderEventsStreamTest(TestCase):
+    def create_event(self, event_id):
+        return OrderEvent.objects.create(id=event_id, order_id=event_id, kind=OrderEvent.UPDATED, payload={'id': event_id})
+
+    def test_event_committed_out_of_order_is_not_skipped(self):
+        self.create_event(1)
+        self.create_event(3)
+        stream = stream_order_events(1)
+        self.assertTrue(next(stream).startswith('retry:'))
+        self.assertTrue(next(stream).startswith('id: 3\n'))
+        self.assertEqual(next(stream), ': ping\n\n')
+
+        # Транзакция с событием 2 зафиксировалась позже, чем с событием 3
+        self.create_event(2)
+
+        late_event = next(stream)
+        self.assertTrue(late_event.startswith('event: updated\ndata: {"id": 2}'))
+        self.assertEqual(next(stream), ': ping\n\n')
+        self.assertEqual(next(stream), ': ping\n\n')
+        stream.close()
+
+    @override_settings(ORDER_EVENTS_MAX_STREAMS=1, ORDER_EVENTS_FALLBACK_INTERVAL=10)
+    def test_streams_over_limit_fall_back_to_polling(self):
+        self.create_event(1)
+        first = serve_order_events(0)
+        self.assertEqual(next(first), 'retry: 1000\n\n')
+
+        second = list(serve_order_events(0))
+        self.assertEqual(second[0], 'retry: 10000\n\n')
+        self.assertTrue(second[1].startswith('id: 1\n'))
+        self.assertEqual(len(second), 2)
+
+        first.close()
+        third = serve_order_events(0)
+        self.assertEqual(next(third), 'retry: 1000\n\n')
+        third.close()
+
+    def test_polling_resends_events_after_recent_gap(self):
+        self.create_event(1)
+        self.create_event(3)
+
+        events = list(poll_order_events(0))[1:]
+        self.assertTrue(events[0].startswith('id: 1\n'))
+        self.assertTrue(events[1].startswith('event: updated\ndata: {"id": 3}'))
+
+        # Спустя ORDER_EVENTS_GAP_TIMEOUT секунд пропуск уже не заполнится
+        OrderEvent.objects.update(created_at=timezone.now() - timedelta(minutes=1))
+        events = list(poll_order_events(1))[1:]
+        self.assertTrue(events[0].startswith('id: 3\n'))
+
+    def test_old_events_are_pruned(self):
+        old_event = self.create_event(1)
+        self.create_event(2)
+        OrderEvent.objects.filter(pk=old_event.pk).update(created_at=timezone.now() - timedelta(hours=25))
+
+        call_command('prune_order_events', hours=24, stdout=StringIO())
+
+        self.assertQuerySetEqual(OrderEvent.objects.values_list('id', flat=True), [2])
+
+
+class QueryBudgetTest(TestCase):
+    def test_assert_max_queries_reports_repeated_queries(self):
+        with self.assertRaisesMessage(AssertionError, '3 × SELECT'):
+            with assert_max_queries(2):
+                for user_id in range(3):
+                    User.objects.filter(pk=user_id).exists()
+
+    def test_middleware_raises_over_budget(self):
+        @query_budget(0)
+        def view(request):
+            User.objects.exists()
+            return HttpResponse()
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = QueryBudgetMiddleware(get_response)
+        request = RequestFactory().get('/')
+
+        with override_settings(QUERY_BUDGET_MODE='raise'):
+            with self.assertRaises(QueryBudgetExceeded):
+                middleware(request)
+        with override_settings(QUERY_BUDGET_MODE='log'):
+            with self.assertLogs('star_burger.query_budget', 'WARNING'):
+                middleware(request)
+
+
+class MetricsTest(TestCase):
+    def get_sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_metrics_are_exported(self):
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'star_burger_orders_created_total', response.content)
+
+    def test_request_is_observed_by_view_name(self):
+        labels = {'view': 'foodcartapp:product_list_api', 'method': 'GET'}
+        duration_count = self.get_sample('star_burger_request_duration_seconds_count', **labels)
+        requests_count = self.get_sample('star_burger_requests_total', status='200', **labels)
+
+        self.client.get(reverse('foodcartapp:product_list_api'))
+
+        self.assertEqual(self.get_sample('star_burger_request_duration_seconds_count', **labels), duration_count + 1)
+        self.assertEqual(self.get_sample('star_burger_requests_total', status='200', **labels), requests_count + 1)
+
+    def test_order_is_counted_after_commit(self):
+        orders_count = self.get_sample('star_burger_orders_created_total')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Order.objects.create(firstname='Иван', lastname='Иванов', phonenumber='+79291000000', address='Москва')
+        self.assertEqual(self.get_sample('star_burger_orders_created_total'), orders_count)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.get_sample('star_burger_orders_created_total'), orders_count + 1)
@@ -9,11 +9,15 @@ urlpatterns = [
     path('', lambda request: redirect('restaurateur:ProductsView')),
 
     path('products/', views.view_products, name="ProductsView"),
+    path('api/stop-list/', views.stop_list_api, name="stop_list_api"),
 
     path('restaurants/', views.view_restaurants, name="RestaurantView"),
 
     # TODO заглушка для нереализованного функционала
     path('orders/', views.view_orders, name="view_orders"),
+    path('orders/events/', views.order_events, name="order_events"),
+    path('api/orders/', views.orders_api, name="orders_api"),
+    path('api/assignments/', views.assignments_api, name="assignments_api"),
 
     path('login/', views.LoginView.as_view(), name="login"),
     path('logout/', views.LogoutView.as_view(), name="logout"),
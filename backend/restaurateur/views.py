@@ -1,16 +1,64 @@
+import json
+import threading
+import time
+from datetime import timedelta
+
 from django import forms
+from django.core.cache import cache
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
 from django.views import View
 from django.urls import reverse_lazy
 from django.contrib.auth.decorators import user_passes_test
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.views.decorators.http import require_http_methods, require_POST
 
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 
-from foodcartapp.models import Product, Restaurant, Order
-from foodcartapp.services import get_restaurant_distances
-from geocoder_cache.models import GeoPlace
-from geocoder_cache.services import get_coordinates_batch
+from foodcartapp.assignment import apply_assignments, suggest_assignments
+from foodcartapp.caching import (
+    CATALOG_NAMESPACE,
+    RESTAURANTS_NAMESPACE,
+    bump_version,
+    cache_view,
+    get_restaurant_index,
+    get_version,
+)
+from foodcartapp.eta import DeliveryTimePredictor
+from foodcartapp.models import Product, Restaurant, RestaurantMenuItem, Order, OrderEvent
+from foodcartapp.restaurant_load import get_restaurant_loads
+from foodcartapp.services import (
+    MENU_ITEM_AVAILABLE,
+    MENU_ITEM_MISSING,
+    build_availability_matrix,
+    get_orders_restaurant_distances,
+)
+from star_burger.query_budget import query_budget
+from geocoder_cache.services import enqueue_geocoding, get_cached_coordinates
+
+
+ORDERS_API_DEFAULT_LIMIT = 50
+ORDERS_API_MAX_LIMIT = 200
+# На сколько секунд назад сдвигается server_time, чтобы не пропустить заказы из долгих транзакций
+ORDERS_API_UPDATED_SINCE_LAG = 10
+ORDER_EVENTS_BATCH_SIZE = 100
+ORDER_EVENTS_RETRY_MS = 1000
+# Сколько секунд ждать события с пропущенными id и сколько последних пропусков помнить
+ORDER_EVENTS_GAP_TIMEOUT = 10
+ORDER_EVENTS_MAX_GAP = 100
+PRODUCTS_TABLE_CACHE_TIMEOUT = 24 * 60 * 60
+STOP_LIST_MAX_ITEMS = 1000
+
+_active_streams = 0
+_active_streams_lock = threading.Lock()
 
 
 class Login(forms.Form):
@@ -65,71 +113,462 @@ def is_manager(user):
     return user.is_staff  # FIXME replace with specific permission
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_products(request):
-    restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
-
-    products_with_restaurant_availability = []
-    for product in products:
-        availability = {item.restaurant_id: item.availability for item in product.menu_items}
-        ordered_availability = [availability.get(restaurant.id, False) for restaurant in restaurants]
+def render_products_table():
+    """Рисует таблицу доступности товаров по ресторанам тремя запросами без создания позиций меню."""
+    restaurants = list(Restaurant.objects.order_by('name').values('id', 'name'))
+    products = list(Product.objects.select_related('category').order_by('id'))
+    menu_items = RestaurantMenuItem.objects.values_list('product_id', 'restaurant_id', 'availability')
 
-        products_with_restaurant_availability.append(
-            (product, ordered_availability)
+    restaurant_ids = [restaurant['id'] for restaurant in restaurants]
+    matrix = build_availability_matrix(
+        [product.id for product in products],
+        restaurant_ids,
+        menu_items.iterator(),
+    )
+    width = len(restaurants)
+    products_with_restaurant_availability = [
+        (
+            product,
+            [
+                (restaurant_id, state != MENU_ITEM_MISSING, state == MENU_ITEM_AVAILABLE)
+                for restaurant_id, state in zip(restaurant_ids, matrix[index * width:(index + 1) * width])
+            ],
         )
-
-    return render(request, template_name="products_list.html", context={
+        for index, product in enumerate(products)
+    ]
+    return render_to_string('products_table.html', {
         'products_with_restaurant_availability': products_with_restaurant_availability,
         'restaurants': restaurants,
     })
 
 
+@query_budget(6)
 @user_passes_test(is_manager, login_url='restaurateur:login')
+def view_products(request):
+    # Таблица меняется только вместе с меню, поэтому хранится в кэше до смены его версии
+    key = 'restaurateur:products_table:{}.{}'.format(
+        get_version(CATALOG_NAMESPACE),
+        get_version(RESTAURANTS_NAMESPACE),
+    )
+    products_table = cache.get(key)
+    if products_table is None:
+        products_table = render_products_table()
+        cache.set(key, products_table, timeout=PRODUCTS_TABLE_CACHE_TIMEOUT)
+
+    return render(request, template_name="products_list.html", context={
+        'products_table': products_table,
+    })
+
+
+def parse_stop_list(data):
+    """Проверяет тело запроса стоп-листа. Возвращает {(id ресторана, id товара): доступность}."""
+    if not isinstance(data, dict) or not isinstance(data.get('items'), list) or not data['items']:
+        raise ValueError('items должен быть непустым списком')
+    if len(data['items']) > STOP_LIST_MAX_ITEMS:
+        raise ValueError(f'За один запрос можно изменить не больше {STOP_LIST_MAX_ITEMS} позиций')
+
+    changes = {}
+    for item in data['items']:
+        if not isinstance(item, dict):
+            raise ValueError('Каждая позиция должна быть объектом')
+        restaurant_id = item.get('restaurant')
+        product_id = item.get('product')
+        availability = item.get('availability')
+        if type(restaurant_id) is not int or type(product_id) is not int:
+            raise ValueError('restaurant и product должны быть id')
+        if not isinstance(availability, bool):
+            raise ValueError('availability должен быть true или false')
+        changes[restaurant_id, product_id] = availability
+    return changes
+
+
+@query_budget(10)
+@require_POST
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def stop_list_api(request):
+    """Меняет доступность многих позиций меню одним запросом.
+
+    Тело: {"items": [{"restaurant": id, "product": id, "availability": false}, ...]}.
+    Кэши каталога сбрасываются один раз на всю пачку. В ответе число изменённых
+    позиций и новая версия каталога.
+    """
+    try:
+        changes = parse_stop_list(json.loads(request.body))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    restaurant_ids = {restaurant_id for restaurant_id, _ in changes}
+    product_ids = {product_id for _, product_id in changes}
+    with transaction.atomic():
+        menu_items = {
+            (item.restaurant_id, item.product_id): item
+            for item in (
+                RestaurantMenuItem.objects
+                .select_for_update()
+                .filter(restaurant_id__in=restaurant_ids, product_id__in=product_ids)
+                .only('id', 'restaurant_id', 'product_id', 'availability')
+            )
+        }
+        missing = [pair for pair in changes if pair not in menu_items]
+        if missing:
+            return JsonResponse({
+                'error': 'Этих товаров нет в меню ресторанов',
+                'missing': [
+                    {'restaurant': restaurant_id, 'product': product_id}
+                    for restaurant_id, product_id in missing
+                ],
+            }, status=400)
+
+        changed_items = []
+        for pair, availability in changes.items():
+            menu_item = menu_items[pair]
+            if menu_item.availability != availability:
+                menu_item.availability = availability
+                changed_items.append(menu_item)
+        RestaurantMenuItem.objects.bulk_update(changed_items, ['availability'])
+        Product.objects.filter(
+            pk__in={menu_item.product_id for menu_item in changed_items},
+        ).recalculate_available_restaurants_count()
+
+    # bulk_update не шлёт сигналы, поэтому кэши сбрасываются здесь, уже после коммита
+    if changed_items:
+        catalog_version = bump_version(CATALOG_NAMESPACE)
+    else:
+        catalog_version = get_version(CATALOG_NAMESPACE)
+    return JsonResponse({'updated': len(changed_items), 'catalog_version': catalog_version})
+
+
+@query_budget(5)
+@user_passes_test(is_manager, login_url='restaurateur:login')
+@cache_view(RESTAURANTS_NAMESPACE)
 def view_restaurants(request):
     return render(request, template_name="restaurants_list.html", context={
         'restaurants': Restaurant.objects.order_by('name'),
     })
 
 
+def prepare_orders(orders):
+    """Подбирает заказам рестораны по закэшированным координатам и загрузке кухонь и прогнозирует время доставки.
+
+    Возвращает список заказов.
+    """
+    orders = list(orders.with_available_restaurants())
+
+    restaurants = {restaurant for order in orders for restaurant in order.available_restaurants}
+    loads = get_restaurant_loads(restaurant.pk for restaurant in restaurants)
+    for restaurant in restaurants:
+        restaurant.queued_orders = loads[restaurant.pk]
+
+    order_coords, pending_addresses = get_cached_coordinates({order.address for order in orders})
+    enqueue_geocoding(pending_addresses)
+
+    pending_addresses = set(pending_addresses)
+    for order in orders:
+        order.address_pending = order.address in pending_addresses
+
+    get_orders_restaurant_distances(orders, order_coords, loads=loads, index=get_restaurant_index())
+
+    predictor = DeliveryTimePredictor()
+    for order in orders:
+        order.eta_minutes = predictor.predict_order(order, order_coords)
+        order.estimated_delivery_at = (
+            order.created_at + timedelta(minutes=order.eta_minutes) if order.eta_minutes is not None else None
+        )
+    return orders
+
+
+@query_budget(15)
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
     orders = (
         Order.objects
-        .with_total_cost()
         .prefetch_related('items__product')
         .select_related('restaurant')
         .exclude(status='completed')
         .order_by('-created_at')
     )
-    orders = orders.with_available_restaurants()
 
-    all_restaurants = set()
-    order_addresses = set()
-    for order in orders:
-        order_addresses.add(order.address)
-        for restaurant in order.available_restaurants:
-            all_restaurants.add(restaurant)
-    restaurant_addresses = {r.address for r in all_restaurants if r.address}
-    order_addresses = {a for a in order_addresses if a}
-
-    all_addresses = list(restaurant_addresses) + list(order_addresses)
-    all_coordinates = get_coordinates_batch(all_addresses)
-    
-    restaurant_coords = {addr: coords for addr, coords in all_coordinates.items() if addr in restaurant_addresses}
-    order_coords = {addr: coords for addr, coords in all_coordinates.items() if addr in order_addresses}
-
-    for order in orders:
-        if order.available_restaurants:
-            order.restaurant_distances = get_restaurant_distances(
-                order.address,
-                order.available_restaurants,
-                restaurant_coords,
-                order_coords
-            )
-        else:
-            order.restaurant_distances = []
+    last_event = OrderEvent.objects.order_by('-id').values_list('id', flat=True).first()
 
     return render(request, template_name='order_items.html', context={
-        'order_items': orders,
+        'order_items': prepare_orders(orders),
+        'last_event_id': last_event or 0,
     })
+
+
+def get_order_events(last_event_id, missing_ids=(), limit=ORDER_EVENTS_BATCH_SIZE):
+    """Возвращает события заказов с id больше last_event_id и с id из missing_ids в порядке id."""
+    events = OrderEvent.objects.filter(id__gt=last_event_id)
+    if missing_ids:
+        events = events | OrderEvent.objects.filter(id__in=missing_ids)
+    return list(events.order_by('id').values('id', 'kind', 'payload', 'created_at')[:limit])
+
+
+def format_server_sent_event(event, with_id=True):
+    data = json.dumps(event['payload'], cls=DjangoJSONEncoder, ensure_ascii=False)
+    event_id = f"id: {event['id']}\n" if with_id else ''
+    return f"{event_id}event: {event['kind']}\ndata: {data}\n\n"
+
+
+def stream_order_events(last_event_id):
+    """Генерирует поток Server-Sent Events с изменениями заказов.
+
+    Журнал опрашивается одним лёгким запросом раз в ORDER_EVENTS_POLL_INTERVAL
+    секунд. Через ORDER_EVENTS_STREAM_DURATION секунд поток закрывается, чтобы
+    не упираться в таймаут gunicorn: браузер переподключается сам и присылает
+    Last-Event-ID.
+
+    id событий выдаются при вставке, а транзакции фиксируются в своём порядке,
+    поэтому событие с меньшим id может появиться уже после большего. Пропуски
+    в id поток запоминает и ещё ORDER_EVENTS_GAP_TIMEOUT секунд ищет их; такие
+    опоздавшие события отправляются без id, чтобы не сдвигать Last-Event-ID назад.
+    """
+    yield f"retry: {ORDER_EVENTS_RETRY_MS}\n\n"
+    deadline = time.monotonic() + settings.ORDER_EVENTS_STREAM_DURATION
+    missing_ids = {}
+    while time.monotonic() < deadline:
+        now = time.monotonic()
+        missing_ids = {event_id: expires_at for event_id, expires_at in missing_ids.items() if expires_at > now}
+        events = get_order_events(last_event_id, missing_ids)
+        for event in events:
+            if missing_ids.pop(event['id'], None) is not None:
+                yield format_server_sent_event(event, with_id=False)
+                continue
+            for event_id in range(max(last_event_id + 1, event['id'] - ORDER_EVENTS_MAX_GAP), event['id']):
+                missing_ids[event_id] = now + ORDER_EVENTS_GAP_TIMEOUT
+            yield format_server_sent_event(event)
+            last_event_id = event['id']
+        if len(events) < ORDER_EVENTS_BATCH_SIZE:
+            yield ': ping\n\n'
+            # Соединение с БД не держим, пока поток спит. В транзакции его закрыть нельзя
+            if not connection.in_atomic_block:
+                connection.close()
+            time.sleep(settings.ORDER_EVENTS_POLL_INTERVAL)
+
+
+def poll_order_events(last_event_id):
+    """Отдаёт накопившиеся события одним ответом и просит браузер переподключиться через ORDER_EVENTS_FALLBACK_INTERVAL.
+
+    Так страница заказов получает события опросом, не занимая поток сервера.
+    Пропуск в id, появившийся меньше ORDER_EVENTS_GAP_TIMEOUT секунд назад,
+    может ещё заполниться, поэтому события после него отправляются без id и
+    придут снова при следующем опросе.
+    """
+    yield f"retry: {int(settings.ORDER_EVENTS_FALLBACK_INTERVAL * 1000)}\n\n"
+    gap_deadline = timezone.now() - timedelta(seconds=ORDER_EVENTS_GAP_TIMEOUT)
+    has_recent_gap = False
+    while True:
+        events = get_order_events(last_event_id)
+        for event in events:
+            if event['id'] != last_event_id + 1 and event['created_at'] > gap_deadline:
+                has_recent_gap = True
+            yield format_server_sent_event(event, with_id=not has_recent_gap)
+            if not has_recent_gap:
+                last_event_id = event['id']
+        if len(events) < ORDER_EVENTS_BATCH_SIZE:
+            return
+        if has_recent_gap:
+            last_event_id = events[-1]['id']
+
+
+def _acquire_stream_slot():
+    global _active_streams
+    with _active_streams_lock:
+        if _active_streams >= settings.ORDER_EVENTS_MAX_STREAMS:
+            return False
+        _active_streams += 1
+        return True
+
+
+def _release_stream_slot():
+    global _active_streams
+    with _active_streams_lock:
+        _active_streams -= 1
+
+
+def serve_order_events(last_event_id):
+    """Держит поток событий, если в процессе меньше ORDER_EVENTS_MAX_STREAMS потоков, а иначе отдаёт события опросом."""
+    if not _acquire_stream_slot():
+        yield from poll_order_events(last_event_id)
+        return
+    try:
+        yield from stream_order_events(last_event_id)
+    finally:
+        _release_stream_slot()
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def order_events(request):
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if last_event_id and last_event_id.isdigit():
+        last_event_id = int(last_event_id)
+    else:
+        last_event_id = OrderEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    response = StreamingHttpResponse(
+        serve_order_events(last_event_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def encode_orders_cursor(order):
+    value = f'{order.created_at.isoformat()}|{order.id}'
+    return urlsafe_base64_encode(value.encode())
+
+
+def decode_orders_cursor(cursor):
+    """Возвращает (created_at, id) из курсора или бросает ValueError."""
+    created_at, order_id = urlsafe_base64_decode(cursor).decode().split('|')
+    return parse_aware_datetime(created_at), int(order_id)
+
+
+def parse_aware_datetime(value):
+    """Разбирает дату ISO 8601; дату без часового пояса считает заданной в TIME_ZONE. Бросает ValueError."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def dump_order(order):
+    return {
+        'id': order.id,
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'firstname': order.firstname,
+        'lastname': order.lastname,
+        'phonenumber': str(order.phonenumber),
+        'address': order.address,
+        'address_pending': order.address_pending,
+        'payment_method': order.payment_method,
+        'comment': order.comment,
+        'total_cost': order.total_cost,
+        'eta_minutes': order.eta_minutes,
+        'estimated_delivery_at': order.estimated_delivery_at,
+        'restaurant': {
+            'id': order.restaurant.id,
+            'name': order.restaurant.name,
+        } if order.restaurant else None,
+        'available_restaurants': [
+            {
+                'id': restaurant.id,
+                'name': restaurant.name,
+                'address': restaurant.address,
+                'distance': distance,
+                'queued_orders': restaurant.queued_orders,
+            }
+            for restaurant, distance in order.restaurant_distances
+        ],
+        'created_at': order.created_at,
+        'updated_at': order.updated_at,
+    }
+
+
+def dump_assignments(assignments, unassigned_orders):
+    return {
+        'assignments': [
+            {
+                'order': order.id,
+                'restaurant': {
+                    'id': restaurant.id,
+                    'name': restaurant.name,
+                },
+                'distance': distance,
+            }
+            for order, restaurant, distance in assignments
+        ],
+        'total_distance': round(sum(distance for _, _, distance in assignments), 2),
+        'unassigned': [order.id for order in unassigned_orders],
+    }
+
+
+@query_budget(20)
+@require_http_methods(['GET', 'POST'])
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def assignments_api(request):
+    """Автоматически подбирает рестораны открытым заказам без ресторана.
+
+    GET только предлагает назначения, POST подбирает их заново и сохраняет.
+    Ресторан не получает больше заказов, чем указано в его max_active_orders.
+    """
+    if request.method == 'POST':
+        assignments, unassigned_orders = apply_assignments()
+    else:
+        assignments, unassigned_orders = suggest_assignments()
+    return JsonResponse(dump_assignments(assignments, unassigned_orders), json_dumps_params={'ensure_ascii': False})
+
+
+@query_budget(12)
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def orders_api(request):
+    """Отдаёт заказы страницами по курсору (created_at, id) от новых к старым.
+
+    Параметры: status (через запятую), restaurant (id или none), updated_since
+    (ISO 8601), limit и cursor из ответа на предыдущий запрос. Без status и
+    updated_since выполненные заказы не возвращаются.
+
+    server_time из ответа — значение updated_since для следующего запроса. Он
+    отстаёт на ORDERS_API_UPDATED_SINCE_LAG секунд: заказ, сохранённый
+    транзакцией, начатой раньше, но закоммиченной позже запроса, попадёт в
+    следующий ответ. Поэтому соседние ответы перекрываются, и клиент
+    объединяет заказы по id.
+    """
+    orders = (
+        Order.objects
+        .select_related('restaurant')
+        .order_by('-created_at', '-id')
+    )
+
+    try:
+        limit = min(int(request.GET.get('limit', ORDERS_API_DEFAULT_LIMIT)), ORDERS_API_MAX_LIMIT)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': 'limit должен быть положительным числом'}, status=400)
+
+    updated_since = None
+    if request.GET.get('updated_since'):
+        try:
+            updated_since = parse_aware_datetime(request.GET['updated_since'])
+        except ValueError:
+            return JsonResponse({'error': 'Неверный формат updated_since'}, status=400)
+        orders = orders.filter(updated_at__gte=updated_since)
+
+    statuses = [status for status in request.GET.get('status', '').split(',') if status]
+    if statuses:
+        orders = orders.filter(status__in=statuses)
+    elif updated_since is None:
+        orders = orders.exclude(status='completed')
+
+    restaurant = request.GET.get('restaurant')
+    if restaurant == 'none':
+        orders = orders.filter(restaurant__isnull=True)
+    elif restaurant:
+        if not restaurant.isdigit():
+            return JsonResponse({'error': 'restaurant должен быть id ресторана или none'}, status=400)
+        orders = orders.filter(restaurant_id=restaurant)
+
+    if request.GET.get('cursor'):
+        try:
+            created_at, order_id = decode_orders_cursor(request.GET['cursor'])
+        except ValueError:
+            return JsonResponse({'error': 'Неверный курсор'}, status=400)
+        orders = orders.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=order_id)
+        )
+
+    server_time = timezone.now() - timedelta(seconds=ORDERS_API_UPDATED_SINCE_LAG)
+    orders = prepare_orders(orders[:limit + 1])
+    has_next_page = len(orders) > limit
+    orders = orders[:limit]
+
+    return JsonResponse({
+        'results': [dump_order(order) for order in orders],
+        'next_cursor': encode_orders_cursor(orders[-1]) if has_next_page else None,
+        'server_time': server_time,
+    }, json_dumps_params={'ensure_ascii': False})
@@ -0,0 +1,8 @@
+"""Общие функции команд замера производительности."""
+
+
+def percentile(values, percent):
+    """Возвращает перцентиль выборки методом ближайшего ранга."""
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
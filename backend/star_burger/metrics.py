@@ -0,0 +1,116 @@
+"""Метрики приложения в формате Prometheus.
+
+Отдаются представлением metrics_view по адресу /metrics. Под gunicorn у каждого
+воркера свои счётчики, поэтому в продакшене задаётся переменная окружения
+PROMETHEUS_MULTIPROC_DIR: процессы пишут значения в файлы этой директории,
+а /metrics складывает их в общий результат. Без переменной метрики живут
+в памяти процесса — этого достаточно для runserver.
+
+Число заказов в минуту считается в Prometheus:
+rate(star_burger_orders_created_total[5m]) * 60.
+"""
+import os
+import time
+
+from django.db import connection
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+UNMATCHED_VIEW = 'unmatched'
+
+REQUEST_DURATION = Histogram(
+    'star_burger_request_duration_seconds',
+    'Время обработки HTTP-запроса',
+    ['view', 'method'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUESTS = Counter(
+    'star_burger_requests_total',
+    'Число HTTP-запросов',
+    ['view', 'method', 'status'],
+)
+REQUEST_DB_QUERIES = Histogram(
+    'star_burger_request_db_queries',
+    'Число SQL-запросов на HTTP-запрос',
+    ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+REQUEST_DB_DURATION = Histogram(
+    'star_burger_request_db_duration_seconds',
+    'Суммарное время SQL-запросов на HTTP-запрос',
+    ['view'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+GEOCODER_CACHE_LOOKUPS = Counter(
+    'star_burger_geocoder_cache_lookups_total',
+    'Поиск координат в кэше: local_hits, shared_hits, db_hits или misses',
+    ['result'],
+)
+GEOCODER_API_DURATION = Histogram(
+    'star_burger_geocoder_api_duration_seconds',
+    'Время запроса к API геокодера',
+    ['result'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+ORDERS_CREATED = Counter(
+    'star_burger_orders_created_total',
+    'Число созданных заказов',
+)
+
+
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started_at
+
+
+class MetricsMiddleware:
+    """Замеряет время ответа и SQL-запросы каждого HTTP-запроса в разрезе URL."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_timer = QueryTimer()
+        started_at = time.perf_counter()
+        with connection.execute_wrapper(query_timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started_at
+
+        # Имя URL, а не путь: иначе /manager/orders/123/ и подобные плодили бы метки без конца
+        resolver_match = getattr(request, 'resolver_match', None)
+        view = resolver_match.view_name if resolver_match else UNMATCHED_VIEW
+        REQUEST_DURATION.labels(view, request.method).observe(duration)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        REQUEST_DB_QUERIES.labels(view).observe(query_timer.count)
+        REQUEST_DB_DURATION.labels(view).observe(query_timer.duration)
+        return response
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,109 @@
+"""Бюджет SQL-запросов на представление.
+
+Представление объявляет, сколько запросов ему можно сделать:
+
+    @query_budget(10)
+    def view_orders(request):
+        ...
+
+QueryBudgetMiddleware считает запросы каждого HTTP-запроса и при превышении
+бюджета пишет предупреждение в лог или бросает QueryBudgetExceeded — в
+зависимости от настройки QUERY_BUDGET_MODE ('log', 'raise' или 'off').
+Исключение появляется, когда ответ уже готов и транзакция представления
+закоммичена, поэтому 'raise' годится только для тестов.
+В сообщение попадают повторяющиеся запросы — типичный признак N+1.
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Задаёт представлению наибольшее допустимое число SQL-запросов."""
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def get_sql_fingerprint(sql):
+    """Приводит запрос к виду без конкретных значений, чтобы находить повторы."""
+    sql = LITERAL_RE.sub('?', sql)
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+def get_duplicated_queries(queries):
+    """Возвращает [(отпечаток запроса, сколько раз выполнен)] для повторявшихся запросов."""
+    fingerprints = Counter(get_sql_fingerprint(sql) for sql in queries)
+    return [(sql, count) for sql, count in fingerprints.most_common() if count > 1]
+
+
+def format_budget_report(name, queries, max_queries):
+    lines = [f'{name}: {len(queries)} SQL-запросов при бюджете {max_queries}']
+    for sql, count in get_duplicated_queries(queries):
+        lines.append(f'  {count} × {sql}')
+    return '\n'.join(lines)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def record_queries():
+    """Собирает тексты SQL-запросов соединения по умолчанию, даже при DEBUG = False."""
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder.queries
+
+
+@contextmanager
+def assert_max_queries(max_queries, name='блок'):
+    """Проверка для тестов: падает, если внутри блока выполнено больше max_queries запросов."""
+    with record_queries() as queries:
+        yield queries
+    if len(queries) > max_queries:
+        raise AssertionError(format_budget_report(name, queries, max_queries))
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.QUERY_BUDGET_MODE == 'off':
+            return self.get_response(request)
+
+        request.query_budget = None
+        with record_queries() as queries:
+            response = self.get_response(request)
+
+        max_queries = request.query_budget
+        if max_queries is not None and len(queries) > max_queries:
+            report = format_budget_report(request.path, queries, max_queries)
+            if settings.QUERY_BUDGET_MODE == 'raise':
+                raise QueryBudgetExceeded(report)
+            logger.warning(report)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
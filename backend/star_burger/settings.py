@@ -55,7 +55,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'star_burger.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'star_burger.query_budget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -108,10 +110,34 @@ MEDIA_URL = '/media/'
 
 DATABASES = {
     'default': dj_database_url.config(
-        default='sqlite:////{0}'.format(os.path.join(BASE_DIR, 'db.sqlite3'))
+        default='sqlite:////{0}'.format(os.path.join(BASE_DIR, 'db.sqlite3')),
+        conn_max_age=env.int('DB_CONN_MAX_AGE', 60),
+        conn_health_checks=env.bool('DB_CONN_HEALTH_CHECKS', True),
     )
 }
 
+# Пул соединений psycopg 3 на процесс gunicorn. Пул сам держит соединения открытыми,
+# поэтому CONN_MAX_AGE с ним не совместим и обнуляется
+DB_POOL = env.bool('DB_POOL', False)
+if DB_POOL and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': env.int('DB_POOL_MIN_SIZE', 2),
+        'max_size': env.int('DB_POOL_MAX_SIZE', 8),
+        'timeout': env.float('DB_POOL_TIMEOUT', 10),
+    }
+
+# В разработке без CACHE_URL кэш хранится в памяти процесса runserver. В проде нужен общий
+# для воркеров gunicorn кэш с атомарным incr, Redis или Memcached: CACHE_URL=redis://redis:6379/1
+if DEBUG:
+    CACHES = {'default': env.dj_cache_url('CACHE_URL', 'locmem://')}
+else:
+    CACHES = {'default': env.dj_cache_url('CACHE_URL')}
+if CACHES['default']['BACKEND'] == 'django.core.cache.backends.filebased.FileBasedCache':
+    CACHES['default'].setdefault('OPTIONS', {})['MAX_ENTRIES'] = env.int('CACHE_MAX_ENTRIES', 10000)
+# Тесты работают с кэшем в памяти, см. star_burger/test_runner.py
+TEST_RUNNER = 'star_burger.test_runner.TestRunner'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -150,4 +176,60 @@ STATICFILES_DIRS = [
 ]
 
 YANDEX_GEOCODER_API_KEY = env('YANDEX_GEOCODER_API_KEY')
-YANDEX_GEOCODER_BASE_URL = 'https://geocode-maps.yandex.ru/1.x/'
+YANDEX_GEOCODER_BASE_URL = env('YANDEX_GEOCODER_BASE_URL', 'https://geocode-maps.yandex.ru/1.x/')
+YANDEX_GEOCODER_TIMEOUT = env.float('YANDEX_GEOCODER_TIMEOUT', 5)
+# Сколько запросов к геокодеру выполнять одновременно и не чаще скольких в секунду.
+# Оба лимита действуют в каждом процессе отдельно: квоту API делите на число воркеров gunicorn
+# плюс процессы process_geocoding_queue
+YANDEX_GEOCODER_MAX_WORKERS = env.int('YANDEX_GEOCODER_MAX_WORKERS', 8)
+YANDEX_GEOCODER_RATE_LIMIT = env.float('YANDEX_GEOCODER_RATE_LIMIT', 20)
+# Разбирать очередь геокодирования в фоновом потоке веб-процесса.
+# Если выключено, очередь разбирает команда process_geocoding_queue
+GEOCODER_BACKGROUND_WORKER = env.bool('GEOCODER_BACKGROUND_WORKER', True)
+# Кэш координат: LRU в памяти каждого процесса и общий кэш Django (время жизни в секундах)
+GEOCODER_LOCAL_CACHE_SIZE = env.int('GEOCODER_LOCAL_CACHE_SIZE', 10000)
+GEOCODER_LOCAL_CACHE_TTL = env.int('GEOCODER_LOCAL_CACHE_TTL', 600)
+GEOCODER_SHARED_CACHE_TTL = env.int('GEOCODER_SHARED_CACHE_TTL', 24 * 60 * 60)
+# Пауза перед повторным геокодированием адреса после неудачи удваивается с каждой попыткой
+GEOCODER_RETRY_BASE_DELAY = env.int('GEOCODER_RETRY_BASE_DELAY', 5 * 60)
+GEOCODER_RETRY_MAX_DELAY = env.int('GEOCODER_RETRY_MAX_DELAY', 7 * 24 * 60 * 60)
+
+# Живое обновление страницы заказов: как часто опрашивать журнал событий
+# и сколько секунд держать одно SSE-соединение (меньше таймаута gunicorn)
+ORDER_EVENTS_POLL_INTERVAL = env.float('ORDER_EVENTS_POLL_INTERVAL', 2)
+ORDER_EVENTS_STREAM_DURATION = env.float('ORDER_EVENTS_STREAM_DURATION', 25)
+# Каждое SSE-соединение занимает поток gunicorn, поэтому их число в процессе ограничено.
+# Остальные страницы заказов забирают события опросом раз в ORDER_EVENTS_FALLBACK_INTERVAL секунд
+ORDER_EVENTS_MAX_STREAMS = env.int('ORDER_EVENTS_MAX_STREAMS', 2)
+ORDER_EVENTS_FALLBACK_INTERVAL = env.float('ORDER_EVENTS_FALLBACK_INTERVAL', 10)
+# Сколько часов хранить журнал событий заказов; старые события удаляет prune_order_events
+ORDER_EVENTS_RETENTION_HOURS = env.int('ORDER_EVENTS_RETENTION_HOURS', 24)
+
+# Что делать, если представление превысило бюджет SQL-запросов: 'log', 'raise' или 'off'.
+# Исключение бросается уже после коммита транзакции представления, поэтому 'raise'
+# включает только тестовый раннер: клиент, получив 500, повторил бы запрос и создал дубль
+QUERY_BUDGET_MODE = env('QUERY_BUDGET_MODE', 'log')
+
+# Сколько ближайших ресторанов пересчитывать точной формулой geodesic
+DISTANCE_EXACT_TOP_K = env.int('DISTANCE_EXACT_TOP_K', 3)
+# Сколько ближайших ресторанов и в каком радиусе предлагать для заказа
+NEAREST_RESTAURANTS_LIMIT = env.int('NEAREST_RESTAURANTS_LIMIT', 5)
+NEAREST_RESTAURANTS_MAX_KM = env.float('NEAREST_RESTAURANTS_MAX_KM', 50)
+# Из скольких ближайших ресторанов автоматическое назначение выбирает ресторан для заказа
+ASSIGNMENT_CANDIDATES_LIMIT = env.int('ASSIGNMENT_CANDIDATES_LIMIT', 10)
+# Рестораны для заказа предлагаются по оценке времени доставки: очередь кухни
+# плюс дорога. Из скольких ближайших выбирать, сколько минут добавляет каждый
+# заказ в очереди и с какой скоростью едет курьер
+NEAREST_RESTAURANTS_CANDIDATES = env.int('NEAREST_RESTAURANTS_CANDIDATES', 10)
+KITCHEN_MINUTES_PER_QUEUED_ORDER = env.float('KITCHEN_MINUTES_PER_QUEUED_ORDER', 4)
+COURIER_SPEED_KMH = env.float('COURIER_SPEED_KMH', 20)
+
+# Прогноз времени доставки: ширина и число диапазонов расстояний (последний
+# открыт сверху) и сколько доставок нужно, чтобы доверять статистике
+ETA_DISTANCE_BUCKET_KM = env.float('ETA_DISTANCE_BUCKET_KM', 2)
+ETA_DISTANCE_BUCKETS = env.int('ETA_DISTANCE_BUCKETS', 10)
+ETA_MIN_SAMPLES = env.int('ETA_MIN_SAMPLES', 20)
+
+# Доступность товаров по сохранённому счётчику ресторанов. False — проверять
+# позиции меню напрямую, если счётчик разошёлся с меню
+PRODUCT_AVAILABILITY_COUNTER = env.bool('PRODUCT_AVAILABILITY_COUNTER', True)
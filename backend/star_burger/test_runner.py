@@ -0,0 +1,32 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'star_burger-tests',
+    },
+}
+TEST_SETTINGS = {
+    'CACHES': TEST_CACHES,
+    'QUERY_BUDGET_MODE': 'raise',
+}
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с кэшем в памяти, а не в общем кэше из CACHE_URL.
+
+    Тесты очищают кэш, и с общим кэшем из CACHE_URL они стирали бы кэш
+    запущенного рядом сервера. Превышение бюджета SQL-запросов в тестах
+    роняет запрос, а не только пишется в лог.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.settings_override = override_settings(**TEST_SETTINGS)
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        super().teardown_test_environment(**kwargs)